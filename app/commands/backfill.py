@@ -0,0 +1,143 @@
+"""
+Backfill the tables derived from probe results for data written before they existed.
+
+    python -m app.commands.backfill status
+    python -m app.commands.backfill rollups
+
+Results written by the probe engine keep these tables up to date, so a backfill is only needed once after upgrading.
+The runs log storage is only ever written by the probe engine and has nothing to backfill. Only logs kept on the
+primary are backfilled, so run it before moving them to log shards with rebalance_log_shards.
+
+Rollups are only recomputed for buckets closed before the probe writer could still be adding to them, counted back
+from the start of the run. Open buckets keep the counts of the live writer, rerun the backfill later to cover them.
+The oldest bucket of the raw results is only filled in when missing, since retention may have deleted part of it.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from app.config.config import Settings
+from app.daos.log_table_dao import BUCKET_AGGREGATES, ROLLUP_TABLES, log_source
+from app.models import db_models as model
+from app.utils.buckets import ROLLUP_BUCKET_SIZES, bucket_start
+from app.utils.database import SessionLocal, engine
+from app.utils.enums import DatabaseSchemas, LogStorage, ProbeStatus
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+log_config = Settings().log
+probe_config = Settings().probe
+
+# Longest a result may wait in the probe writer, retries included, before its rollups are written
+WRITER_DELAY = timedelta(seconds=float(probe_config["flush_interval"]) * (int(probe_config["flush_retries"]) + 1))
+
+
+async def backfill_status(endpoint: model.Endpoints) -> bool:
+    from_clause, where_clause = log_source(endpoint.log_table, endpoint.id)
+    params = {"endpoint_id": endpoint.id, "ok": ProbeStatus.OK.value}
+
+    async with SessionLocal() as session:
+        exists = await session.execute(text("SELECT to_regclass(:table_name)"), {"table_name": from_clause})
+        if not exists.scalar():
+            return False
+
+        latest = await session.execute(text(
+            f"SELECT status, created_at, response_time FROM {from_clause} WHERE {where_clause} "
+            f"ORDER BY created_at DESC LIMIT 1"
+        ), params)
+        latest = latest.first()
+        if not latest:
+            return False
+
+        failures = await session.execute(text(
+            f"SELECT count(*) FROM {from_clause} WHERE {where_clause} AND created_at > coalesce("
+            f"(SELECT max(created_at) FROM {from_clause} WHERE {where_clause} AND status = :ok), '-infinity')"
+        ), params)
+
+        await session.execute(text(
+            f"INSERT INTO {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoint_status "
+            f"(endpoint_id, status, last_checked_at, response_time, consecutive_failures, changed_at) "
+            f"VALUES (:endpoint_id, :status, :created_at, :response_time, :failures, :created_at) "
+            f"ON CONFLICT (endpoint_id) DO NOTHING"
+        ), {**params, "status": latest.status, "created_at": latest.created_at,
+            "response_time": latest.response_time, "failures": failures.scalar()})
+        await session.commit()
+        return True
+
+
+async def backfill_rollups(endpoint: model.Endpoints) -> bool:
+    """
+    Recompute the hourly and daily rollups of an endpoint from its raw results, leaving alone the buckets the probe
+    writer may still add to, so its increments are not overwritten, and the existing rollup of the oldest bucket,
+    whose older results retention may have deleted.
+    """
+    from_clause, where_clause = log_source(endpoint.log_table, endpoint.id)
+    params = {"endpoint_id": endpoint.id, "ok": ProbeStatus.OK.value, "error": ProbeStatus.ERROR.value}
+    settled = datetime.now() - WRITER_DELAY
+
+    async with SessionLocal() as session:
+        exists = await session.execute(text("SELECT to_regclass(:table_name)"), {"table_name": from_clause})
+        if not exists.scalar():
+            return False
+
+        oldest = await session.execute(text(f"SELECT min(created_at) FROM {from_clause} WHERE {where_clause}"),
+                                       params)
+        oldest = oldest.scalar()
+        if not oldest:
+            return False
+
+        for granularity, table_name in ROLLUP_TABLES.items():
+            bucket_size = ROLLUP_BUCKET_SIZES[granularity]
+            await session.execute(text(
+                f"INSERT INTO {DatabaseSchemas.LOG_SCHEMA.value}.{table_name} "
+                f"(endpoint_id, bucket, ok_count, error_count, worst_status, min_response_time, max_response_time, "
+                f"sum_response_time, last_error_at, last_error) "
+                f"SELECT :endpoint_id, date_trunc('{granularity.value}', created_at), {BUCKET_AGGREGATES} "
+                f"FROM {from_clause} WHERE {where_clause} AND created_at IS NOT NULL AND created_at < :closed "
+                f"GROUP BY 2 "
+                f"ON CONFLICT (endpoint_id, bucket) DO UPDATE SET "
+                f"ok_count = EXCLUDED.ok_count, error_count = EXCLUDED.error_count, "
+                f"worst_status = EXCLUDED.worst_status, min_response_time = EXCLUDED.min_response_time, "
+                f"max_response_time = EXCLUDED.max_response_time, sum_response_time = EXCLUDED.sum_response_time, "
+                f"last_error_at = EXCLUDED.last_error_at, last_error = EXCLUDED.last_error "
+                f"WHERE EXCLUDED.bucket > :oldest_bucket"
+            ), {**params, "closed": bucket_start(settled, bucket_size),
+                "oldest_bucket": bucket_start(oldest, bucket_size)})
+
+        await session.commit()
+        return True
+
+
+TARGETS = {
+    "status": backfill_status,
+    "rollups": backfill_rollups,
+}
+
+
+async def backfill(target: str):
+    if log_config["storage"] == LogStorage.RUNS.value:
+        LOGGER.info("The runs log storage is kept up to date by the probe engine, nothing to backfill.")
+        return
+
+    async with SessionLocal() as session:
+        result = await session.execute(select(model.Endpoints)
+                                       .where(model.Endpoints.log_table.isnot(None), model.Endpoints.shard.is_(None))
+                                       .order_by(model.Endpoints.id))
+        endpoints = result.scalars().all()
+
+    for index, endpoint in enumerate(endpoints, start=1):
+        backfilled = await TARGETS[target](endpoint)
+        LOGGER.info(f"[{index}/{len(endpoints)}] Endpoint ID {endpoint.id}: "
+                    f"{'backfilled' if backfilled else 'nothing to backfill'}.")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill tables derived from probe results.")
+    parser.add_argument("target", choices=list(TARGETS), help="what to backfill")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.target))
@@ -0,0 +1,74 @@
+"""
+Add the (created_at, id) index to every existing per-endpoint log table.
+
+    python -m app.commands.create_log_indexes [--dry-run]
+
+Indexes are built with CREATE INDEX CONCURRENTLY, so probes keep writing and dashboards keep reading while it runs.
+An index left invalid by an interrupted build is dropped and built again, so the command can be re-run at any time.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.models.db_models import log_table_index_name
+from app.utils.database import engine
+from app.utils.enums import DatabaseSchemas
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+LOG_SCHEMA = DatabaseSchemas.LOG_SCHEMA.value
+
+# Per-endpoint tables are named t<uuid>, see EndpointService.generate_table_name
+SELECT_LOG_TABLES = text(
+    "SELECT c.relname, i.indisvalid "
+    "FROM pg_class c "
+    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "LEFT JOIN pg_class ic ON ic.relname = c.relname || '_created_at_idx' AND ic.relnamespace = n.oid "
+    "LEFT JOIN pg_index i ON i.indexrelid = ic.oid "
+    "WHERE n.nspname = :schema AND c.relkind = 'r' AND c.relname ~ '^t[0-9a-f_]{36}$' "
+    "ORDER BY c.relname"
+)
+
+
+async def create_indexes(dry_run: bool):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+
+        result = await connection.execute(SELECT_LOG_TABLES, {"schema": LOG_SCHEMA})
+        pending = [(table_name, is_valid) for table_name, is_valid in result.all() if not is_valid]
+        LOGGER.info(f"{len(pending)} log tables need the created_at index.")
+
+        if dry_run:
+            for table_name, is_valid in pending:
+                LOGGER.info(f"Would index {LOG_SCHEMA}.{table_name}{' (rebuild invalid)' if is_valid is False else ''}.")
+            return
+
+        started = time.monotonic()
+        for index, (table_name, is_valid) in enumerate(pending, start=1):
+            index_name = log_table_index_name(table_name)
+            table_started = time.monotonic()
+
+            if is_valid is False:
+                await connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {LOG_SCHEMA}.{index_name}"))
+
+            await connection.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {LOG_SCHEMA}.{table_name} (created_at, id)"
+            ))
+
+            elapsed = time.monotonic() - started
+            remaining = elapsed / index * (len(pending) - index)
+            LOGGER.info(f"[{index}/{len(pending)}] Indexed {LOG_SCHEMA}.{table_name} in "
+                        f"{time.monotonic() - table_started:.1f}s, about {remaining:.0f}s remaining.")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the created_at index to existing log tables.")
+    parser.add_argument("--dry-run", action="store_true", help="only list the tables that would be indexed")
+    args = parser.parse_args()
+
+    asyncio.run(create_indexes(args.dry_run))
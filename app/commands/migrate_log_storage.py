@@ -0,0 +1,87 @@
+"""
+Copy the per-endpoint log.t<uuid> tables into the partitioned log.probe_results table.
+
+Run it once before switching log_storage to "partitioned":
+
+    python -m app.commands.migrate_log_storage [--drop]
+
+Every table is copied in its own transaction and then renamed to <table>_migrated, or dropped with --drop, so an
+interrupted migration can simply be started again. Only the tables on the primary are migrated, run it before
+spreading the logs over log shards with rebalance_log_shards.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select, text
+
+from app.daos.log_table_dao import LogTableDAO
+from app.models import db_models as model
+from app.models.db_models import PARTITIONED_LOG_TABLE, create_log_partitions, create_partitioned_log_table
+from app.utils.database import SessionLocal, engine
+from app.utils.enums import DatabaseSchemas
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+LOG_SCHEMA = DatabaseSchemas.LOG_SCHEMA.value
+
+
+async def migrate_table(endpoint_id: int, table_name: str, drop: bool) -> int:
+    table_name = LogTableDAO._sanitize_table_name(table_name)
+
+    async with SessionLocal() as session:
+        exists = await session.execute(text("SELECT to_regclass(:table_name)"),
+                                       {"table_name": f"{LOG_SCHEMA}.{table_name}"})
+        if not exists.scalar():
+            return 0
+
+        bounds = await session.execute(text(f"SELECT min(created_at), max(created_at) FROM {LOG_SCHEMA}.{table_name}"))
+        first, last = bounds.one()
+
+    if first:
+        await create_log_partitions(first.date(), last.date())
+
+    async with SessionLocal() as session:
+        # Holds off the writer until the table is renamed or dropped, so no result lands after the copy
+        await session.execute(text(f"LOCK TABLE {LOG_SCHEMA}.{table_name} IN SHARE MODE"))
+        # Rows without created_at cannot be routed to a partition and are left behind
+        copied = await session.execute(text(
+            f"INSERT INTO {LOG_SCHEMA}.{PARTITIONED_LOG_TABLE} "
+            f"(endpoint_id, status, created_at, response, response_hash, response_time) "
+            f"SELECT :endpoint_id, status, created_at, response, response_hash, response_time "
+            f"FROM {LOG_SCHEMA}.{table_name} WHERE created_at IS NOT NULL"
+        ), {"endpoint_id": endpoint_id})
+
+        if drop:
+            await session.execute(text(f"DROP TABLE {LOG_SCHEMA}.{table_name}"))
+        else:
+            await session.execute(text(f"ALTER TABLE {LOG_SCHEMA}.{table_name} RENAME TO {table_name}_migrated"))
+
+        await session.commit()
+        return copied.rowcount
+
+
+async def migrate(drop: bool):
+    await create_partitioned_log_table()
+
+    async with SessionLocal() as session:
+        result = await session.execute(select(model.Endpoints.id, model.Endpoints.log_table)
+                                       .where(model.Endpoints.log_table.isnot(None), model.Endpoints.shard.is_(None))
+                                       .order_by(model.Endpoints.id))
+        endpoints = result.all()
+
+    total_rows = 0
+    for index, (endpoint_id, table_name) in enumerate(endpoints, start=1):
+        rows = await migrate_table(endpoint_id, table_name, drop)
+        total_rows += rows
+        LOGGER.info(f"[{index}/{len(endpoints)}] Endpoint ID {endpoint_id}: copied {rows} rows from {table_name}.")
+
+    LOGGER.info(f"Migrated {total_rows} rows of {len(endpoints)} endpoints into {LOG_SCHEMA}.{PARTITIONED_LOG_TABLE}.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate per-endpoint log tables into the partitioned log table.")
+    parser.add_argument("--drop", action="store_true", help="drop the old tables instead of renaming them")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.drop))
@@ -0,0 +1,116 @@
+"""
+Collapse the results kept in the per-endpoint log.t<uuid> tables, or in the partitioned log.probe_results table, into
+runs in log.probe_runs.
+
+Run it once before switching log_storage to "runs", otherwise the history written before the switch is no longer read:
+
+    python -m app.commands.migrate_to_runs [--drop]
+
+Runs are split like the probe engine splits them: on every status change and once they span log_heartbeat_interval.
+Every endpoint is collapsed in its own transaction, holding off writes to its source meanwhile. Log tables are then
+renamed to <table>_migrated, or dropped with --drop; the rows of the partitioned table are only deleted with --drop.
+Endpoints that already have runs are skipped, so an interrupted migration can simply be started again. Only the
+logs on the primary are migrated, run it before spreading them over log shards with rebalance_log_shards.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select, text
+
+from app.config.config import Settings
+from app.daos.log_table_dao import RUNS_TABLE, LogTableDAO
+from app.models import db_models as model
+from app.models.db_models import PARTITIONED_LOG_TABLE
+from app.utils.database import SessionLocal, engine
+from app.utils.enums import DatabaseSchemas
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+LOG_SCHEMA = DatabaseSchemas.LOG_SCHEMA.value
+log_config = Settings().log
+
+
+def collapse_query(source: str, condition: str) -> str:
+    """
+    Runs of the results selected from source: consecutive results of the same status form an island, which is cut
+    into slices of the heartbeat interval counted from its first result.
+    """
+    return (
+        f"WITH ordered AS ("
+        f"SELECT status, created_at, response, response_hash, response_time, "
+        f"row_number() OVER (ORDER BY created_at, id) - "
+        f"row_number() OVER (PARTITION BY status ORDER BY created_at, id) AS island "
+        f"FROM {source} WHERE {condition} AND created_at IS NOT NULL), "
+        f"sliced AS ("
+        f"SELECT *, floor(extract(epoch FROM created_at - min(created_at) OVER (PARTITION BY status, island)) "
+        f"/ :heartbeat) AS slice FROM ordered) "
+        f"INSERT INTO {RUNS_TABLE} "
+        f"(endpoint_id, status, first_seen, last_seen, count, min_response_time, max_response_time, "
+        f"sum_response_time, response, response_hash) "
+        f"SELECT :endpoint_id, status, min(created_at), max(created_at), count(*), min(response_time), "
+        f"max(response_time), coalesce(sum(response_time), 0), "
+        f"(array_agg(response ORDER BY created_at))[1], (array_agg(response_hash ORDER BY created_at))[1] "
+        f"FROM sliced GROUP BY status, island, slice"
+    )
+
+
+async def migrate_endpoint(endpoint_id: int, table_name: str, drop: bool) -> int:
+    table_name = LogTableDAO._sanitize_table_name(table_name)
+    params = {"endpoint_id": endpoint_id, "heartbeat": int(log_config["heartbeat_interval"])}
+
+    async with SessionLocal() as session:
+        has_runs = await session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {RUNS_TABLE} "
+                                              f"WHERE endpoint_id = :endpoint_id)"), params)
+        if has_runs.scalar():
+            return 0
+
+        sources = await session.execute(text("SELECT to_regclass(:table_name), to_regclass(:partitioned)"), {
+            "table_name": f"{LOG_SCHEMA}.{table_name}",
+            "partitioned": f"{LOG_SCHEMA}.{PARTITIONED_LOG_TABLE}"
+        })
+        table_exists, partitioned_exists = sources.one()
+
+        if table_exists:
+            # Holds off the writer until the table is renamed or dropped, so no result lands after the copy
+            await session.execute(text(f"LOCK TABLE {LOG_SCHEMA}.{table_name} IN SHARE MODE"))
+            runs = await session.execute(text(collapse_query(f"{LOG_SCHEMA}.{table_name}", "TRUE")), params)
+            if drop:
+                await session.execute(text(f"DROP TABLE {LOG_SCHEMA}.{table_name}"))
+            else:
+                await session.execute(text(f"ALTER TABLE {LOG_SCHEMA}.{table_name} RENAME TO {table_name}_migrated"))
+        elif partitioned_exists:
+            partitioned = f"{LOG_SCHEMA}.{PARTITIONED_LOG_TABLE}"
+            await session.execute(text(f"LOCK TABLE {partitioned} IN SHARE MODE"))
+            runs = await session.execute(text(collapse_query(partitioned, "endpoint_id = :endpoint_id")), params)
+            if drop:
+                await session.execute(text(f"DELETE FROM {partitioned} WHERE endpoint_id = :endpoint_id"), params)
+        else:
+            return 0
+
+        await session.commit()
+        return runs.rowcount
+
+
+async def migrate(drop: bool):
+    async with SessionLocal() as session:
+        result = await session.execute(select(model.Endpoints.id, model.Endpoints.log_table)
+                                       .where(model.Endpoints.log_table.isnot(None), model.Endpoints.shard.is_(None))
+                                       .order_by(model.Endpoints.id))
+        endpoints = result.all()
+
+    total_runs = 0
+    for index, (endpoint_id, table_name) in enumerate(endpoints, start=1):
+        runs = await migrate_endpoint(endpoint_id, table_name, drop)
+        total_runs += runs
+        LOGGER.info(f"[{index}/{len(endpoints)}] Endpoint ID {endpoint_id}: collapsed into {runs} runs.")
+
+    LOGGER.info(f"Migrated {len(endpoints)} endpoints into {total_runs} runs in {RUNS_TABLE}.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collapse the results of the log tables into runs.")
+    parser.add_argument("--drop", action="store_true", help="drop the old tables or rows instead of keeping them")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.drop))
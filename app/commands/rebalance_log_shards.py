@@ -0,0 +1,209 @@
+"""
+Move the logs of every endpoint to the log shard its log table hashes to.
+
+Add the new databases at the end of log_shards, restart every worker with it, then run:
+
+    python -m app.commands.rebalance_log_shards [--dry-run] [--settle SECONDS] [--batch-size N]
+
+Consistent hashing only moves the endpoints that hash to a new shard, plus the endpoints created before sharding,
+whose logs start on the primary. Moving endpoints are switched to their new shard first, so new results are written
+there, and after waiting --settle seconds for writes already under way, their older logs are moved over in batches.
+Until then their history reads as incomplete. A batch already copied is not copied twice, so an interrupted rebalance
+can simply be started again. Results without created_at cannot be ordered into batches and are dropped.
+"""
+import argparse
+import asyncio
+from typing import List, Optional
+
+from sqlalchemy import select, text
+
+from app.config.config import Settings
+from app.daos.endpoints_dao import EndpointDAO
+from app.daos.log_table_dao import RESPONSES_TABLE, RUNS_TABLE, LogTableDAO
+from app.models import db_models as model
+from app.models.db_models import (PARTITIONED_LOG_TABLE, create_log_partitions, create_log_table,
+                                  create_partitioned_log_table, create_shard_log_tables)
+from app.utils.database import SessionLocal, engine, log_shards
+from app.utils.enums import DatabaseSchemas, LogStorage
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+LOG_SCHEMA = DatabaseSchemas.LOG_SCHEMA.value
+log_config = Settings().log
+
+RESULT_COLUMNS = ["endpoint_id", "status", "created_at", "response", "response_hash", "response_time"]
+RUN_COLUMNS = ["endpoint_id", "status", "first_seen", "last_seen", "count", "min_response_time",
+               "max_response_time", "sum_response_time", "response", "response_hash"]
+
+
+def location_name(shard: Optional[int]) -> str:
+    return "primary" if shard is None else f"shard {shard}"
+
+
+def raw_source(endpoint: model.Endpoints):
+    """Table, condition, columns and ordering column of the raw logs of an endpoint in the configured storage."""
+    if log_config["storage"] == LogStorage.RUNS.value:
+        return RUNS_TABLE, "endpoint_id = :endpoint_id", RUN_COLUMNS, "first_seen"
+
+    if log_config["storage"] == LogStorage.PARTITIONED.value:
+        return f"{LOG_SCHEMA}.{PARTITIONED_LOG_TABLE}", "endpoint_id = :endpoint_id", RESULT_COLUMNS, "created_at"
+
+    table_name = LogTableDAO._sanitize_table_name(endpoint.log_table)
+    return f"{LOG_SCHEMA}.{table_name}", "TRUE", RESULT_COLUMNS, "created_at"
+
+
+async def has_logs(endpoint: model.Endpoints, shard: Optional[int]) -> bool:
+    table, condition, _, _ = raw_source(endpoint)
+    async with log_shards.session(shard) as session:
+        exists = await session.execute(text("SELECT to_regclass(:table_name)"), {"table_name": table})
+        if not exists.scalar():
+            return False
+        # An empty log table is still moved, so it gets dropped
+        if log_config["storage"] == LogStorage.TABLE.value:
+            return True
+
+        found = await session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE {condition})"),
+                                      {"endpoint_id": endpoint.id})
+        return found.scalar()
+
+
+async def copy_responses(hashes: List[str], source: Optional[int], target: Optional[int]):
+    """Copy the deduplicated responses a batch refers to, the target keeps the ones it already has."""
+    if not hashes:
+        return
+
+    async with log_shards.session(source) as session:
+        result = await session.execute(text(
+            f"SELECT hash, CAST(response AS TEXT) AS response, last_seen_at FROM {RESPONSES_TABLE} "
+            f"WHERE hash = ANY(CAST(:hashes AS VARCHAR[]))"
+        ), {"hashes": hashes})
+        responses = [row._asdict() for row in result]
+    if not responses:
+        return
+
+    async with log_shards.session(target) as session:
+        await session.execute(text(
+            f"INSERT INTO {RESPONSES_TABLE} (hash, response, last_seen_at) "
+            f"VALUES (:hash, CAST(:response AS JSONB), :last_seen_at) ON CONFLICT (hash) DO NOTHING"
+        ), responses)
+        await session.commit()
+
+
+async def move_logs(endpoint: model.Endpoints, source: Optional[int], target: Optional[int], batch_size: int) -> int:
+    """
+    Move the raw logs of an endpoint in batches, oldest first. Each batch is committed on the target before it is
+    deleted from the source, rows the target already holds for the same time are skipped.
+    """
+    table, condition, columns, key = raw_source(endpoint)
+    selected = ", ".join(f"CAST({column} AS TEXT) AS {column}" if column == "response" else column
+                         for column in columns)
+    inserted = ", ".join("CAST(:response AS JSONB)" if column == "response" else f":{column}" for column in columns)
+
+    moved = 0
+    while True:
+        async with log_shards.session(source) as session:
+            result = await session.execute(text(
+                f"SELECT id, {selected} FROM {table} WHERE {condition} AND {key} IS NOT NULL "
+                f"ORDER BY {key}, id LIMIT :batch_size"
+            ), {"endpoint_id": endpoint.id, "batch_size": batch_size})
+            rows = [row._asdict() for row in result]
+        if not rows:
+            break
+
+        first, last = rows[0][key], rows[-1][key]
+        if log_config["storage"] == LogStorage.PARTITIONED.value:
+            await create_log_partitions(first.date(), last.date(), target)
+        await copy_responses(sorted({row["response_hash"] for row in rows if row["response_hash"]}), source, target)
+
+        async with log_shards.session(target) as session:
+            existing = await session.execute(text(
+                f"SELECT {key} FROM {table} WHERE {condition} AND {key} BETWEEN :first AND :last"
+            ), {"endpoint_id": endpoint.id, "first": first, "last": last})
+            existing = set(existing.scalars().all())
+
+            missing = [{column: row[column] for column in columns} for row in rows if row[key] not in existing]
+            if missing:
+                await session.execute(text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({inserted})"),
+                                      missing)
+            await session.commit()
+
+        async with log_shards.session(source) as session:
+            await session.execute(text(
+                f"DELETE FROM {table} WHERE {condition} AND {key} BETWEEN :first AND :last "
+                f"AND id = ANY(CAST(:ids AS BIGINT[]))"
+            ), {"endpoint_id": endpoint.id, "first": first, "last": last, "ids": [row["id"] for row in rows]})
+            await session.commit()
+
+        moved += len(missing)
+        if len(rows) < batch_size:
+            break
+
+    # Drops the log table, or the rows left without created_at
+    await LogTableDAO(shard=source).delete_log_table(endpoint.log_table, endpoint.id)
+    return moved
+
+
+async def rebalance(dry_run: bool, settle: float, batch_size: int):
+    if not log_shards.enabled:
+        LOGGER.info("No log shards are configured, nothing to rebalance.")
+        return
+
+    async with SessionLocal() as session:
+        result = await session.execute(select(model.Endpoints)
+                                       .where(model.Endpoints.log_table.isnot(None))
+                                       .order_by(model.Endpoints.id))
+        endpoints = result.scalars().all()
+
+    # Endpoints whose logs are anywhere but on their shard, including the leftovers of an interrupted rebalance
+    moves = []
+    for endpoint in endpoints:
+        target = log_shards.assign(endpoint.log_table)
+        sources = [shard for shard in log_shards.targets() if shard != target and await has_logs(endpoint, shard)]
+        if endpoint.shard != target or sources:
+            moves.append((endpoint, target, sources))
+    LOGGER.info(f"{len(moves)} of {len(endpoints)} endpoints need to move.")
+
+    if dry_run:
+        for endpoint, target, sources in moves:
+            LOGGER.info(f"Would move endpoint ID {endpoint.id} from "
+                        f"{', '.join(location_name(source) for source in sources) or 'nowhere'} "
+                        f"to {location_name(target)}.")
+        await engine.dispose()
+        await log_shards.dispose()
+        return
+
+    for shard in range(len(log_shards.engines)):
+        await create_shard_log_tables(shard)
+        if log_config["storage"] == LogStorage.PARTITIONED.value:
+            await create_partitioned_log_table(shard)
+
+    switched = [(endpoint, target) for endpoint, target, _ in moves if endpoint.shard != target]
+    for endpoint, target in switched:
+        if log_config["storage"] == LogStorage.TABLE.value:
+            await create_log_table(endpoint.log_table, target)
+        # Notifies every worker, which drop the endpoint from their caches
+        await EndpointDAO().update(endpoint.id, {"shard": target})
+    if switched:
+        LOGGER.info(f"Switched {len(switched)} endpoints to their new shards, waiting {settle:.0f}s for writes "
+                    f"under way.")
+        await asyncio.sleep(settle)
+
+    for index, (endpoint, target, sources) in enumerate(moves, start=1):
+        for source in sources:
+            rows = await move_logs(endpoint, source, target, batch_size)
+            LOGGER.info(f"[{index}/{len(moves)}] Endpoint ID {endpoint.id}: moved {rows} rows from "
+                        f"{location_name(source)} to {location_name(target)}.")
+
+    await engine.dispose()
+    await log_shards.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move endpoint logs to the log shards they hash to.")
+    parser.add_argument("--dry-run", action="store_true", help="only list the endpoints that would move")
+    parser.add_argument("--settle", type=float, default=30.0,
+                        help="seconds to wait after switching endpoints before moving their logs")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows moved per transaction")
+    args = parser.parse_args()
+
+    asyncio.run(rebalance(args.dry_run, args.settle, args.batch_size))
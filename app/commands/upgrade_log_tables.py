@@ -0,0 +1,34 @@
+"""
+Add the response_hash column to the log tables that predate deduplicated responses.
+
+    python -m app.commands.upgrade_log_tables [--lock-timeout 5s]
+
+Startup does the same, this runs it ahead of a deploy or finishes the tables startup skipped. Every table is altered
+in its own transaction, so only one is locked at a time and only for as long as adding a column without a default
+takes. Tables busy for longer than the lock timeout are skipped; the command can be re-run at any time.
+"""
+import argparse
+import asyncio
+
+from app.models.db_models import add_response_hash_columns
+from app.utils.database import engine
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+
+
+async def upgrade(lock_timeout: str):
+    upgraded, skipped = await add_response_hash_columns(lock_timeout)
+    LOGGER.info(f"Added response_hash to {len(upgraded)} log tables.")
+    if skipped:
+        LOGGER.warning(f"Could not lock {len(skipped)} log tables, run the command again: {', '.join(skipped)}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add response_hash to log tables that predate it.")
+    parser.add_argument("--lock-timeout", default="5s", help="how long to wait for the lock on each table")
+    args = parser.parse_args()
+
+    asyncio.run(upgrade(args.lock_timeout))
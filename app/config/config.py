@@ -1,3 +1,5 @@
+import os
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -18,11 +20,44 @@ class Settings(BaseSettings):
     app_ssl_cert: str = Field(..., env="app_ssl_cert")
     app_admin_email: str = Field(..., env="app_admin_email")
     app_admin_pass: str = Field(..., env="app_admin_pass")
+    app_session_store: str = Field("cookie", env="app_session_store")
+    app_session_store_size: int = Field(100000, env="app_session_store_size")
+    app_workers: int = Field(1, env="app_workers")
 
     db_host: str = Field(..., env="db_host")
     db_user: str = Field(..., env="db_user")
     db_password: str = Field(..., env="db_password")
     db_name: str = Field(..., env="db_name")
+    db_max_connections: int = Field(100, env="db_max_connections")
+    db_replicas: str = Field("", env="db_replicas")
+    db_replica_max_lag: float = Field(30.0, env="db_replica_max_lag")
+    db_replica_check_interval: float = Field(5.0, env="db_replica_check_interval")
+
+    log_storage: str = Field("table", env="log_storage")
+    log_partitions_ahead: int = Field(7, env="log_partitions_ahead")
+    log_retention_days: int = Field(0, env="log_retention_days")
+    log_rollup_retention_days: int = Field(0, env="log_rollup_retention_days")
+    log_retention_batch_size: int = Field(5000, env="log_retention_batch_size")
+    log_heartbeat_interval: int = Field(3600, env="log_heartbeat_interval")
+    log_runs_flush_interval: float = Field(60.0, env="log_runs_flush_interval")
+    log_shards: str = Field("", env="log_shards")
+
+    probe_enabled: bool = Field(True, env="probe_enabled")
+    probe_concurrency: int = Field(500, env="probe_concurrency")
+    probe_timeout: float = Field(10.0, env="probe_timeout")
+    probe_refresh_interval: int = Field(60, env="probe_refresh_interval")
+    probe_cron_cache_size: int = Field(1024, env="probe_cron_cache_size")
+    probe_jitter: int = Field(60, env="probe_jitter")
+    probe_buffer_size: int = Field(50000, env="probe_buffer_size")
+    probe_batch_size: int = Field(1000, env="probe_batch_size")
+    probe_flush_interval: float = Field(1.0, env="probe_flush_interval")
+    probe_flush_retries: int = Field(300, env="probe_flush_retries")
+    probe_publish_results: bool = Field(True, env="probe_publish_results")
+
+    cache_endpoint_ttl: float = Field(5.0, env="cache_endpoint_ttl")
+    cache_endpoint_size: int = Field(10000, env="cache_endpoint_size")
+    cache_principal_ttl: float = Field(30.0, env="cache_principal_ttl")
+    cache_principal_size: int = Field(10000, env="cache_principal_size")
 
     @property
     def app(self) -> Dict[str, str]:
@@ -39,7 +74,11 @@ class Settings(BaseSettings):
             "ssl_cert": self.app_ssl_cert,
             "ssl_key": self.app_ssl_key,
             "admin_email": self.app_admin_email,
-            "admin_pass": self.app_admin_pass
+            "admin_pass": self.app_admin_pass,
+            "session_store": self.app_session_store,
+            "session_store_size": self.app_session_store_size,
+            # 0 starts one worker per CPU core
+            "workers": self.app_workers or os.cpu_count() or 1
         }
 
     @property
@@ -48,7 +87,49 @@ class Settings(BaseSettings):
             "host": self.db_host,
             "user": self.db_user,
             "password": self.db_password,
-            "name": self.db_name
+            "name": self.db_name,
+            "max_connections": self.db_max_connections,
+            "replicas": [dsn.strip() for dsn in self.db_replicas.split(",") if dsn.strip()],
+            "replica_max_lag": self.db_replica_max_lag,
+            "replica_check_interval": self.db_replica_check_interval
+        }
+
+    @property
+    def log(self) -> Dict[str, str]:
+        return {
+            "storage": self.log_storage,
+            "partitions_ahead": self.log_partitions_ahead,
+            "retention_days": self.log_retention_days,
+            "rollup_retention_days": self.log_rollup_retention_days,
+            "retention_batch_size": self.log_retention_batch_size,
+            "heartbeat_interval": self.log_heartbeat_interval,
+            "runs_flush_interval": self.log_runs_flush_interval,
+            "shards": [dsn.strip() for dsn in self.log_shards.split(",") if dsn.strip()]
+        }
+
+    @property
+    def probe(self) -> Dict[str, str]:
+        return {
+            "enabled": self.probe_enabled,
+            "concurrency": self.probe_concurrency,
+            "timeout": self.probe_timeout,
+            "refresh_interval": self.probe_refresh_interval,
+            "cron_cache_size": self.probe_cron_cache_size,
+            "jitter": self.probe_jitter,
+            "buffer_size": self.probe_buffer_size,
+            "batch_size": self.probe_batch_size,
+            "flush_interval": self.probe_flush_interval,
+            "flush_retries": self.probe_flush_retries,
+            "publish_results": self.probe_publish_results
+        }
+
+    @property
+    def cache(self) -> Dict[str, str]:
+        return {
+            "endpoint_ttl": self.cache_endpoint_ttl,
+            "endpoint_size": self.cache_endpoint_size,
+            "principal_ttl": self.cache_principal_ttl,
+            "principal_size": self.cache_principal_size
         }
 
     class Config:
@@ -1,15 +1,33 @@
 import asyncio
 import hashlib
 
+import asyncpg
+
 from sqlalchemy import create_engine, select, text
 
 from app.config.config import Settings
-from app.models.db_models import Base
-from app.utils.database import SQLALCHEMY_DATABASE_URL, SessionLocal
+from app.models.db_models import Base, add_response_hash_columns, create_shard_log_tables
+from app.utils.database import SQLALCHEMY_DATABASE_URL, SessionLocal, log_shards, replicas
 from app.models import db_models as model
-from app.utils.enums import AccessLevel, DatabaseSchemas
-
+from app.services.leader_srv import leader_election
+from app.services.log_writer_srv import log_writer
+from app.services.maintenance_srv import maintenance_service
+from app.services.notify_srv import notify_listener
+from app.services.probe_srv import probe_engine
+from app.utils.enums import AccessLevel, AdvisoryLocks, DatabaseSchemas
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
 config = Settings().app
+probe_config = Settings().probe
+
+# create_all only creates missing tables, columns added to existing tables are applied here
+SCHEMA_UPGRADES = [
+    f"ALTER TABLE {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints ADD COLUMN IF NOT EXISTS jitter SMALLINT",
+    f"ALTER TABLE {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints ADD COLUMN IF NOT EXISTS retention_days SMALLINT",
+    f"ALTER TABLE {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints ADD COLUMN IF NOT EXISTS shard SMALLINT",
+    # Log tables that predate deduplicated responses are upgraded one at a time, see add_response_hash_columns
+]
 
 
 async def create_admin_user():
@@ -46,17 +64,66 @@ async def create_schemas():
         await session.commit()
 
 
+async def upgrade_schemas():
+    async with SessionLocal() as session:
+        for upgrade_sql in SCHEMA_UPGRADES:
+            await session.execute(text(upgrade_sql))
+
+        await session.commit()
+
+    upgraded, skipped = await add_response_hash_columns()
+    if upgraded:
+        LOGGER.info(f"Added response_hash to {len(upgraded)} log tables.")
+    if skipped:
+        # Writes to these tables fail until they are upgraded, by the next start or by the upgrade command
+        LOGGER.warning(f"Could not lock {len(skipped)} log tables to add response_hash, run "
+                       f"python -m app.commands.upgrade_log_tables: {', '.join(skipped)}")
+
+
+async def setup_database():
+    """Create and upgrade the schemas. Workers starting together take turns, the later ones find it all in place."""
+    # The lock is held on a connection of its own, the setup itself may need every connection of the pool
+    connection = await asyncpg.connect(SQLALCHEMY_DATABASE_URL)
+    try:
+        await connection.execute("SELECT pg_advisory_lock($1)", AdvisoryLocks.SCHEMA_SETUP.value)
+        await create_schemas()
+
+        engine = create_engine(SQLALCHEMY_DATABASE_URL)
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+        await upgrade_schemas()
+        for shard in range(len(log_shards.engines)):
+            await create_shard_log_tables(shard)
+
+        await create_admin_user()
+    finally:
+        # Closing the connection releases the lock
+        await connection.close()
+
+
 async def startup_event():
-    # Database setup
-    await create_schemas()
+    await setup_database()
+    await replicas.start()
 
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    Base.metadata.create_all(bind=engine)
+    # The caches and the status event broker subscribe when they are created, on import. Every worker listens.
+    await notify_listener.start()
 
-    await create_admin_user()
+    # The background services run in a single worker, the one holding the leader lock. Storage maintenance starts
+    # first so partitions exist before the probe engine writes; services stop in reverse order on shutdown, which
+    # stops probing first so the results still in flight end up in the final flush.
+    leader_election.register(maintenance_service.start, maintenance_service.stop)
+    if probe_config.get("enabled"):
+        leader_election.register(log_writer.start, log_writer.stop)
+        leader_election.register(probe_engine.start, probe_engine.stop)
+    await leader_election.start()
 
 
 async def shutdown_event():
+    await leader_election.stop()
+    await notify_listener.stop()
+    await replicas.stop()
+    await log_shards.dispose()
+
     tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
     [task.cancel() for task in tasks]
     await asyncio.gather(*tasks, return_exceptions=True)
@@ -3,6 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.config.config import Settings
+from app.utils.db_stats import DatabaseStatsMiddleware
+from app.utils.enums import SessionStores
+from app.utils.session_store import ServerSideSessionMiddleware, create_session_store
 
 config = Settings().app
 
@@ -24,8 +27,18 @@ def configure(app: FastAPI):
         allow_headers=["*"],
     )
 
-    app.add_middleware(SessionMiddleware,
-                       secret_key=config['secret_key'],
-                       https_only=True,
-                       same_site=same_site_value,
-                       max_age=int(config['session_lifetime']))
+    if config['session_store'] == SessionStores.COOKIE.value:
+        app.add_middleware(SessionMiddleware,
+                           secret_key=config['secret_key'],
+                           https_only=True,
+                           same_site=same_site_value,
+                           max_age=int(config['session_lifetime']))
+    else:
+        app.add_middleware(ServerSideSessionMiddleware,
+                           store=create_session_store(),
+                           https_only=True,
+                           same_site=same_site_value,
+                           max_age=int(config['session_lifetime']))
+
+    # Added last so it wraps the session middleware, whose store may query the database too
+    app.add_middleware(DatabaseStatsMiddleware)
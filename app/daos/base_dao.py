@@ -0,0 +1,35 @@
+from contextlib import nullcontext
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils import database
+
+
+class BaseDAO:
+    """
+    Runs its queries on the sessions of the request when it is given them, see database.get_db and get_read_db, so
+    every DAO of a request shares them. Background tasks give none and get sessions of their own, closed after each
+    call. Reads that tolerate replication lag go to read_db, a replica when any is configured.
+    """
+
+    def __init__(self, db: Optional[AsyncSession] = None, read_db: Optional[AsyncSession] = None):
+        self._owned: List[AsyncSession] = []
+        self.db = db or self._own(database.SessionLocal())
+        self.read_db = read_db or (self._own(database.create_read_session()) if database.replicas.enabled
+                                   else self.db)
+
+    def _own(self, session: AsyncSession) -> AsyncSession:
+        self._owned.append(session)
+        return session
+
+    def _context(self, session: AsyncSession):
+        return session if session in self._owned else nullcontext(session)
+
+    def session(self):
+        """Context of a single call, which closes the session afterwards only when the DAO owns it."""
+        return self._context(self.db)
+
+    def read_session(self):
+        """Same as session, for read_db."""
+        return self._context(self.read_db)
@@ -1,12 +1,13 @@
-from typing import List
+from typing import List, Optional
 
 from psycopg2 import errorcodes
-from sqlalchemy import select, delete, update, text
+from sqlalchemy import func, select, delete, update
 from sqlalchemy.exc import IntegrityError
 
+from app.daos.base_dao import BaseDAO
 from app.models import db_models as model
 from app.schemas.endpoints_sch import CreateEndpointInDb
-from app.utils import database
+from app.utils.enums import NotifyChannels
 
 
 class DuplicateEndpointError(Exception):
@@ -14,79 +15,79 @@ class DuplicateEndpointError(Exception):
         self.detail = detail
 
 
-class EndpointDAO:
-    def __init__(self):
-        self.db = database.SessionLocal()
+class EndpointDAO(BaseDAO):
+    async def _notify_change(self, endpoint_id: int):
+        """Tell the other workers about a change to the endpoint, delivered when the transaction commits."""
+        await self.db.execute(select(func.pg_notify(NotifyChannels.ENDPOINT_CHANGES.value, str(endpoint_id))))
 
     async def get_all(self) -> List[model.Endpoints]:
         """Fetch all endpoints."""
-        async with self.db:
+        async with self.session():
             result = await self.db.execute(select(model.Endpoints).order_by(model.Endpoints.created_at))
             return result.scalars().all()
 
     async def get_all_with_latest_log_status(self):
         """Fetch all endpoints with their latest log status."""
-        async with self.db:
-            try:
-                # Fetch all endpoints
-                result = await self.db.execute(select(model.Endpoints).order_by(model.Endpoints.created_at))
-                endpoints = result.scalars().all()
-
-                # Fetch the latest log status for each endpoint
-                for endpoint in endpoints:
-                    if endpoint.log_table:
-                        log_table_name = f"log.{endpoint.log_table}"
-                        latest_log_result = await self.db.execute(
-                            select(text('status'))
-                            .select_from(text(log_table_name))
-                            .order_by(text('created_at DESC'))
-                            .limit(1)
-                        )
-                        latest_log = latest_log_result.scalar()
-                        endpoint.status = latest_log
-
-                return endpoints
-            except Exception as e:
-                await self.db.rollback()
-                raise e
+        async with self.session():
+            result = await self.db.execute(select(model.Endpoints, model.EndpointStatus)
+                                           .outerjoin(model.EndpointStatus,
+                                                      model.EndpointStatus.endpoint_id == model.Endpoints.id)
+                                           .order_by(model.Endpoints.created_at))
+            return [endpoint.with_status(endpoint_status) for endpoint, endpoint_status in result.all()]
+
+    async def get_many_with_latest_log_status(self, endpoint_ids: Optional[List[int]] = None,
+                                              application_id: Optional[int] = None) -> List[model.Endpoints]:
+        """Fetch the endpoints with the given IDs and/or of the given application with their latest log status."""
+        query = (select(model.Endpoints, model.EndpointStatus)
+                 .outerjoin(model.EndpointStatus, model.EndpointStatus.endpoint_id == model.Endpoints.id)
+                 .order_by(model.Endpoints.id))
+        if endpoint_ids:
+            query = query.where(model.Endpoints.id.in_(endpoint_ids))
+        if application_id is not None:
+            query = query.where(model.Endpoints.application_id == application_id)
+
+        async with self.session():
+            result = await self.db.execute(query)
+            return [endpoint.with_status(endpoint_status) for endpoint, endpoint_status in result.all()]
 
     async def get_by_id(self, endpoint_id: int) -> model.Endpoints:
         """Fetch a specific endpoint by its ID."""
-        async with self.db:
+        async with self.session():
             result = await self.db.execute(select(model.Endpoints).where(model.Endpoints.id == endpoint_id))
             return result.scalars().first()
 
     async def get_by_id_with_latest_log_status(self, endpoint_id: int) -> model.Endpoints:
-        """Fetch a specific endpoint by its ID."""
-        async with self.db:
-            result = await self.db.execute(select(model.Endpoints).where(model.Endpoints.id == endpoint_id))
-            endpoint = result.scalars().first()
+        """Fetch a specific endpoint by its ID with its latest log status."""
+        async with self.session():
+            result = await self.db.execute(select(model.Endpoints, model.EndpointStatus)
+                                           .outerjoin(model.EndpointStatus,
+                                                      model.EndpointStatus.endpoint_id == model.Endpoints.id)
+                                           .where(model.Endpoints.id == endpoint_id))
+            row = result.first()
+            if not row:
+                return None
+
+            endpoint, endpoint_status = row
+            return endpoint.with_status(endpoint_status)
 
-            if endpoint.log_table:
-                log_table_name = f"log.{endpoint.log_table}"
-                latest_log_result = await self.db.execute(
-                    select(text('status'))
-                    .select_from(text(log_table_name))
-                    .order_by(text('created_at DESC'))
-                    .limit(1)
-                )
-                latest_log = latest_log_result.scalar()
-                endpoint.status = latest_log
-
-            return endpoint
     async def update(self, endpoint_id: int, updated_data) -> model.Endpoints:
         """Update an existing endpoint."""
-        async with self.db:
-            await self.db.execute(update(model.Endpoints)
-                                  .where(model.Endpoints.id == endpoint_id).values(**updated_data))
+        async with self.session():
+            # RETURNING hands back the updated row, instead of reading it again after the commit
+            result = await self.db.execute(update(model.Endpoints)
+                                           .where(model.Endpoints.id == endpoint_id).values(**updated_data)
+                                           .returning(model.Endpoints)
+                                           .execution_options(populate_existing=True))
+            endpoint = result.scalars().first()
+            await self._notify_change(endpoint_id)
             await self.db.commit()
-
-        return await self.get_by_id(endpoint_id)
+            return endpoint
 
     async def delete(self, endpoint_id: int):
         """Delete an endpoint."""
-        async with self.db:
+        async with self.session():
             await self.db.execute(delete(model.Endpoints).where(model.Endpoints.id == endpoint_id))
+            await self._notify_change(endpoint_id)
             await self.db.commit()
 
     async def create(self, db_data: CreateEndpointInDb) -> model.Endpoints:
@@ -101,11 +102,16 @@ class EndpointDAO:
             cron=db_data.cron,
             status_code=db_data.status_code,
             response=db_data.response,
-            type=db_data.type
+            type=db_data.type,
+            jitter=db_data.jitter,
+            retention_days=db_data.retention_days,
+            shard=db_data.shard
         )
         try:
-            async with self.db:
+            async with self.session():
                 self.db.add(endpoint)
+                await self.db.flush()
+                await self._notify_change(endpoint.id)
                 await self.db.commit()
                 return endpoint
         except IntegrityError as e:
@@ -1,13 +1,156 @@
+import hashlib
+import json
 import re
+from collections import defaultdict
+from contextlib import AsyncExitStack
 from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.config import Settings
+from app.daos.base_dao import BaseDAO
+from app.models import db_models as model
+from app.models.db_models import PARTITIONED_LOG_TABLE, SHARD_BATCHES_TABLE
 from app.utils import database
-from app.utils.enums import DatabaseSchemas
+from app.utils.buckets import ROLLUP_BUCKET_SIZES, bucket_start
+from app.utils.enums import DatabaseSchemas, LogStorage, NotifyChannels, ProbeStatus, RollupGranularity
+
+log_config = Settings().log
+probe_config = Settings().probe
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+RESPONSES_TABLE = f"{DatabaseSchemas.LOG_SCHEMA.value}.{model.Responses.__tablename__}"
+SHARD_BATCHES = f"{DatabaseSchemas.LOG_SCHEMA.value}.{SHARD_BATCHES_TABLE}"
+
+
+def resolve_response(prefix: str = "") -> str:
+    """
+    Expression of the response of a result row: deduplicated responses are looked up in log.responses by hash,
+    rows written before deduplication still hold their own.
+    """
+    return (f"coalesce({prefix}response, (SELECT stored.response FROM {RESPONSES_TABLE} stored "
+            f"WHERE stored.hash = {prefix}response_hash))")
+
+
+# Aggregates of raw results matching the columns of the rollup tables, for a query grouped by bucket
+BUCKET_AGGREGATES = (
+    "count(*) FILTER (WHERE status = :ok) AS ok_count, "
+    "count(*) FILTER (WHERE status IS DISTINCT FROM :ok) AS error_count, "
+    "CASE WHEN bool_and(status = :ok) THEN :ok ELSE :error END AS worst_status, "
+    "min(response_time) AS min_response_time, max(response_time) AS max_response_time, "
+    "coalesce(sum(response_time), 0) AS sum_response_time, "
+    "max(created_at) FILTER (WHERE status IS DISTINCT FROM :ok) AS last_error_at, "
+    f"(array_agg(jsonb_build_object('status', status, 'created_at', created_at, 'response', {resolve_response()}, "
+    "'response_time', response_time) ORDER BY created_at DESC) "
+    "FILTER (WHERE status IS DISTINCT FROM :ok))[1] AS last_error"
+)
+
+RUNS_TABLE = f"{DatabaseSchemas.LOG_SCHEMA.value}.{model.ProbeRuns.__tablename__}"
+
+
+def runs_source(run_conditions: List[str], newest_runs: bool = False) -> str:
+    """
+    Runs expanded back into results: count results spread evenly from first_seen to last_seen, each with the run's
+    average response time and the run's ID. Only the runs matching run_conditions are expanded, and with newest_runs
+    only the limit + 1 newest of them, which hold at least the limit newest results.
+    """
+    run_query = f"SELECT * FROM {RUNS_TABLE} WHERE {' AND '.join(['endpoint_id = :endpoint_id', *run_conditions])}"
+    if newest_runs:
+        run_query += " ORDER BY first_seen DESC, id DESC LIMIT :limit + 1"
+    return (
+        f"(SELECT r.id, r.endpoint_id, r.status, "
+        f"CASE WHEN r.count > 1 THEN r.first_seen + (r.last_seen - r.first_seen) * s.i / (r.count - 1) "
+        f"ELSE r.first_seen END AS created_at, r.response, r.response_hash, "
+        f"CAST(r.sum_response_time / NULLIF(r.count, 0) AS INTEGER) AS response_time "
+        f"FROM ({run_query}) AS r CROSS JOIN LATERAL generate_series(0, r.count - 1) AS s(i)) AS runs"
+    )
+
+
+# Share of each run in the buckets it overlaps, assuming its results are spread evenly between first and last seen
+RUN_BUCKET_SHARES = (
+    f"SELECT r.endpoint_id, s.bucket, r.status, r.first_seen, r.last_seen, {resolve_response('r.')} AS response, "
+    f"r.min_response_time, r.max_response_time, "
+    f"CAST(r.sum_response_time AS FLOAT8) / r.count AS avg_response_time, "
+    f"CASE WHEN r.last_seen > r.first_seen THEN r.count * "
+    f"extract(epoch FROM LEAST(r.last_seen, s.bucket + :minutes * interval '1 minute') - "
+    f"GREATEST(r.first_seen, s.bucket)) / extract(epoch FROM r.last_seen - r.first_seen) "
+    f"ELSE r.count END AS share "
+    f"FROM {RUNS_TABLE} r CROSS JOIN LATERAL generate_series("
+    f"date_trunc('hour', r.first_seen) + "
+    f"floor(date_part('minute', r.first_seen) / :minutes) * :minutes * interval '1 minute', "
+    f"r.last_seen, :minutes * interval '1 minute') AS s(bucket) "
+    f"WHERE r.endpoint_id = ANY(CAST(:endpoint_ids AS INTEGER[])) AND r.last_seen >= :since AND s.bucket >= :since "
+    f"AND (s.bucket < r.last_seen OR r.last_seen = r.first_seen)"
+)
+
+# Same columns as BUCKET_AGGREGATES over run shares; errors are rounded up so a bucket never hides one
+RUN_BUCKET_AGGREGATES = (
+    "CAST(round(coalesce(sum(share) FILTER (WHERE status = :ok), 0)) AS INTEGER) AS ok_count, "
+    "CAST(ceil(coalesce(sum(share) FILTER (WHERE status IS DISTINCT FROM :ok), 0)) AS INTEGER) AS error_count, "
+    "CASE WHEN bool_and(status = :ok) THEN :ok ELSE :error END AS worst_status, "
+    "min(min_response_time) AS min_response_time, max(max_response_time) AS max_response_time, "
+    "CAST(round(coalesce(sum(share * avg_response_time), 0)) AS BIGINT) AS sum_response_time, "
+    "max(LEAST(last_seen, bucket + :minutes * interval '1 minute')) "
+    "FILTER (WHERE status IS DISTINCT FROM :ok) AS last_error_at, "
+    "(array_agg(jsonb_build_object('status', status, 'created_at', first_seen, 'response', response, "
+    "'response_time', round(avg_response_time)) ORDER BY first_seen DESC) "
+    "FILTER (WHERE status IS DISTINCT FROM :ok))[1] AS last_error"
+)
+
+ROLLUP_TABLES = {
+    RollupGranularity.HOUR: model.RollupHourly.__tablename__,
+    RollupGranularity.DAY: model.RollupDaily.__tablename__,
+}
+
 
-class LogTableDAO:
-    def __init__(self):
-        self.db = database.SessionLocal()
+class LogRecord(NamedTuple):
+    """A single probe result waiting to be written to the log table of its endpoint."""
+    log_table: str
+    endpoint_id: int
+    status: str
+    response: Optional[dict]
+    response_time: int
+    created_at: datetime
+
+
+def log_source(table_name: str, endpoint_id: int, run_conditions: Optional[List[str]] = None,
+               newest_runs: bool = False):
+    """
+    FROM and WHERE clauses selecting one endpoint's results in the configured log storage layout. Runs are expanded
+    into results, run_conditions narrow down the runs to expand, see runs_source.
+    """
+    if log_config["storage"] == LogStorage.RUNS.value:
+        return runs_source(run_conditions or [], newest_runs), "TRUE"
+
+    if log_config["storage"] == LogStorage.PARTITIONED.value:
+        return f"{DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE}", "endpoint_id = :endpoint_id"
+
+    return f"{DatabaseSchemas.LOG_SCHEMA.value}.{LogTableDAO._sanitize_table_name(table_name)}", "TRUE"
+
+
+class LogTableDAO(BaseDAO):
+    """
+    Log storage of the primary, or of a single log shard when given one. The latest statuses, the rollups and the
+    notifications always live on the primary, whichever shard holds the raw results.
+    """
+
+    def __init__(self, db: Optional[AsyncSession] = None, read_db: Optional[AsyncSession] = None,
+                 shard: Optional[int] = None):
+        self.shard = shard
+        if shard is not None:
+            # Shards have no replicas, the session of the shard serves the reads as well
+            db = read_db = database.log_shards.session(shard)
+        super().__init__(db, read_db)
+        if shard is not None:
+            self._own(self.db)
+
+    def for_shard(self, shard: Optional[int]) -> "LogTableDAO":
+        """DAO on the storage of the given shard, this one when it is the same, so the primary keeps the sessions."""
+        return self if shard == self.shard else LogTableDAO(shard=shard)
 
     @classmethod
     def _sanitize_table_name(cls, table_name):
@@ -16,51 +159,705 @@ class LogTableDAO:
             raise ValueError("Invalid table name")
         return table_name
 
-    async def delete_log_table(self, table_name: str):
-        """Delete a log table from the log schema."""
-        sanitized_table_name = self._sanitize_table_name(table_name)
-        drop_table_sql = f"DROP TABLE IF EXISTS {DatabaseSchemas.LOG_SCHEMA.value}.{sanitized_table_name};"
+    async def delete_log_table(self, table_name: str, endpoint_id: int):
+        """Delete the logs of an endpoint: its own log table, or its rows of the partitioned or runs table."""
+        if log_config["storage"] == LogStorage.RUNS.value:
+            delete_sql = f"DELETE FROM {RUNS_TABLE} WHERE endpoint_id = :endpoint_id;"
+        elif log_config["storage"] == LogStorage.PARTITIONED.value:
+            delete_sql = (f"DELETE FROM {DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE} "
+                          f"WHERE endpoint_id = :endpoint_id;")
+        else:
+            sanitized_table_name = self._sanitize_table_name(table_name)
+            delete_sql = f"DROP TABLE IF EXISTS {DatabaseSchemas.LOG_SCHEMA.value}.{sanitized_table_name};"
 
-        async with self.db:
+        async with self.session():
             try:
-                await self.db.execute(text(drop_table_sql))
+                await self.db.execute(text(delete_sql), {"endpoint_id": endpoint_id})
                 await self.db.commit()
             except Exception as e:
                 await self.db.rollback()
                 raise e
 
-    async def select_all_from_log_table(self, table_name: str):
-        """Select all records from a specific log table."""
-        sanitized_table_name = self._sanitize_table_name(table_name)
-        select_query = f"SELECT * FROM {DatabaseSchemas.LOG_SCHEMA.value}.{sanitized_table_name};"
+    async def select_page(self, table_name: str, endpoint_id: int, since: Optional[datetime],
+                          until: Optional[datetime], before: Optional[Tuple[datetime, int]], limit: int,
+                          include_response: bool = False):
+        """
+        Select one page of records of an endpoint, newest first, using keyset pagination on (created_at, id).
+        Records older than the before key are returned, so every page costs the same however deep it is.
+        """
+        # Responses are only resolved when asked for, most pages only need the statuses
+        columns = "id, status, created_at, response_time"
+        if include_response:
+            columns += f", {resolve_response()} AS response"
+        conditions, run_conditions = [], []
+        params = {"endpoint_id": endpoint_id, "limit": limit}
 
-        async with self.db:
+        if since:
+            conditions.append("created_at >= :since")
+            run_conditions.append("last_seen >= :since")
+            params["since"] = since
+        if until:
+            conditions.append("created_at < :until")
+            run_conditions.append("first_seen < :until")
+            params["until"] = until
+        if before:
+            conditions.append("(created_at, id) < (:before_created_at, :before_id)")
+            run_conditions.append("first_seen <= :before_created_at")
+            params["before_created_at"], params["before_id"] = before
+
+        from_clause, where_clause = log_source(table_name, endpoint_id, run_conditions, newest_runs=True)
+        conditions.insert(0, where_clause)
+        select_query = (
+            f"SELECT {columns} FROM {from_clause} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY created_at DESC, id DESC LIMIT :limit;"
+        )
+
+        async with self.read_session():
             try:
-                result = await self.db.execute(text(select_query))
+                result = await self.read_db.execute(text(select_query), params)
                 records = result.fetchall()
                 return records
             except Exception as e:
-                await self.db.rollback()
+                await self.read_db.rollback()
+                raise e
+
+    async def stream_records(self, table_name: str, endpoint_id: int, since: Optional[datetime],
+                             until: Optional[datetime], chunk_size: int = 1000) -> AsyncIterator[list]:
+        """
+        Stream all records of an endpoint, oldest first, in chunks read from a server-side cursor, so memory use
+        does not depend on the size of the log table.
+        """
+        conditions, run_conditions = [], []
+        params = {"endpoint_id": endpoint_id}
+
+        if since:
+            conditions.append("created_at >= :since")
+            run_conditions.append("last_seen >= :since")
+            params["since"] = since
+        if until:
+            conditions.append("created_at < :until")
+            run_conditions.append("first_seen < :until")
+            params["until"] = until
+
+        from_clause, where_clause = log_source(table_name, endpoint_id, run_conditions)
+        conditions.insert(0, where_clause)
+        columns = f"id, status, created_at, {resolve_response()} AS response, response_time"
+
+        select_query = (
+            f"SELECT {columns} FROM {from_clause} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY created_at, id;"
+        )
+
+        async with self.read_session():
+            try:
+                result = await self.read_db.stream(text(select_query), params)
+                async for records in result.partitions(chunk_size):
+                    yield records
+            except Exception as e:
+                await self.read_db.rollback()
+                raise e
+
+    async def delete_logs_before(self, table_name: str, endpoint_id: int, cutoff: datetime, batch_size: int) -> int:
+        """
+        Delete the records of an endpoint older than the cutoff in batches, committing after each batch so no lock
+        is held for long and vacuum can keep up.
+        """
+        from_clause, where_clause = log_source(table_name, endpoint_id)
+        delete_query = (
+            f"DELETE FROM {from_clause} WHERE {where_clause} AND (created_at, id) IN ("
+            f"SELECT created_at, id FROM {from_clause} WHERE {where_clause} AND created_at < :cutoff "
+            f"LIMIT :batch_size);"
+        )
+        if log_config["storage"] == LogStorage.RUNS.value:
+            # A run expires once its last result is past the cutoff
+            delete_query = (
+                f"DELETE FROM {RUNS_TABLE} WHERE id IN ("
+                f"SELECT id FROM {RUNS_TABLE} WHERE endpoint_id = :endpoint_id AND last_seen < :cutoff "
+                f"LIMIT :batch_size);"
+            )
+
+        deleted = 0
+        while True:
+            async with self.session():
+                try:
+                    result = await self.db.execute(text(delete_query), {
+                        "endpoint_id": endpoint_id,
+                        "cutoff": cutoff,
+                        "batch_size": batch_size
+                    })
+                    await self.db.commit()
+                except Exception as e:
+                    await self.db.rollback()
+                    raise e
+
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
+
+    async def select_logs_from_last_hours(self, table_name: str, endpoint_id: int, hours: int):
+        """Select records of an endpoint for the last given hours."""
+        from_clause, where_clause = log_source(table_name, endpoint_id)
+        select_query = f"SELECT * FROM {from_clause} WHERE {where_clause} AND created_at >= :since;"
+
+        async with self.read_session():
+            try:
+                result = await self.read_db.execute(text(select_query), {
+                    "endpoint_id": endpoint_id,
+                    "since": datetime.now() - timedelta(hours=hours)
+                })
+                records = result.fetchall()
+                return records
+            except Exception as e:
+                await self.read_db.rollback()
                 raise e
 
-    async def select_logs_from_last_hours(self, table_name: str, hours: int):
-        """Select records from a specific log table for the last 24 hours."""
-        sanitized_table_name = self._sanitize_table_name(table_name)
-        # Calculate the timestamp for 24 hours ago
-        twenty_four_hours_ago = datetime.now() - timedelta(hours=hours)
-        # Format the timestamp in a way that's compatible with your database
-        formatted_timestamp = twenty_four_hours_ago.strftime("%Y-%m-%d %H:%M:%S")
+    async def select_latest_runs(self, endpoint_ids: List[int]):
+        """Newest run of each of the given endpoints that can be read, with the number of results it holds so far."""
+        if not endpoint_ids:
+            return []
 
         select_query = (
-            f"SELECT * FROM {DatabaseSchemas.LOG_SCHEMA.value}.{sanitized_table_name} "
-            f"WHERE created_at >= '{formatted_timestamp}';"
+            f"SELECT DISTINCT ON (endpoint_id) endpoint_id, id, last_seen, count FROM {RUNS_TABLE} "
+            f"WHERE endpoint_id = ANY(CAST(:endpoint_ids AS INTEGER[])) "
+            f"ORDER BY endpoint_id, first_seen DESC, id DESC;"
         )
 
-        async with self.db:
+        async with self.read_session():
+            try:
+                result = await self.read_db.execute(text(select_query), {"endpoint_ids": endpoint_ids})
+                return result.fetchall()
+            except Exception as e:
+                await self.read_db.rollback()
+                raise e
+
+    async def select_buckets(self, table_name: str, endpoint_id: int, since: datetime, bucket_minutes: int):
+        """
+        Aggregate the records of an endpoint into buckets of the given minutes (a divisor of an hour), grouped by the
+        database so only one row per bucket is transferred.
+        """
+        return await self.select_buckets_many({endpoint_id: table_name}, since, bucket_minutes)
+
+    async def select_buckets_many(self, log_tables: Dict[int, str], since: datetime, bucket_minutes: int):
+        """
+        Aggregate the records of many endpoints, given as endpoint ID to log table, into buckets of the given minutes
+        in a single query, ordered by endpoint and bucket. Runs are spread over every bucket they overlap.
+        """
+        if not log_tables:
+            return []
+
+        bucket_expression = ("date_trunc('hour', created_at) + "
+                             "floor(date_part('minute', created_at) / :minutes) * :minutes * interval '1 minute'")
+        params = {
+            "endpoint_ids": list(log_tables),
+            "since": since,
+            "minutes": bucket_minutes,
+            "ok": ProbeStatus.OK.value,
+            "error": ProbeStatus.ERROR.value
+        }
+
+        if log_config["storage"] == LogStorage.RUNS.value:
+            select_query = (
+                f"SELECT endpoint_id, bucket, {RUN_BUCKET_AGGREGATES} "
+                f"FROM ({RUN_BUCKET_SHARES}) AS shares GROUP BY endpoint_id, bucket ORDER BY endpoint_id, bucket;"
+            )
+        elif log_config["storage"] == LogStorage.PARTITIONED.value:
+            select_query = (
+                f"SELECT endpoint_id, {bucket_expression} AS bucket, {BUCKET_AGGREGATES} "
+                f"FROM {DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE} "
+                f"WHERE endpoint_id = ANY(CAST(:endpoint_ids AS INTEGER[])) AND created_at >= :since "
+                f"GROUP BY 1, 2 ORDER BY 1, 2;"
+            )
+        else:
+            # One table per endpoint: each is aggregated on its own index and the results are appended
+            parts = []
+            for index, (endpoint_id, table_name) in enumerate(log_tables.items()):
+                parts.append(
+                    f"(SELECT CAST(:endpoint_id_{index} AS INTEGER) AS endpoint_id, {bucket_expression} AS bucket, "
+                    f"{BUCKET_AGGREGATES} "
+                    f"FROM {DatabaseSchemas.LOG_SCHEMA.value}.{self._sanitize_table_name(table_name)} "
+                    f"WHERE created_at >= :since GROUP BY 2)"
+                )
+                params[f"endpoint_id_{index}"] = endpoint_id
+            select_query = f"{' UNION ALL '.join(parts)} ORDER BY endpoint_id, bucket;"
+
+        async with self.read_session():
             try:
-                result = await self.db.execute(text(select_query))
+                result = await self.read_db.execute(text(select_query), params)
                 records = result.fetchall()
                 return records
             except Exception as e:
+                await self.read_db.rollback()
+                raise e
+
+    @classmethod
+    def _insert_query(cls, table_name: str) -> str:
+        return (
+            f"INSERT INTO {DatabaseSchemas.LOG_SCHEMA.value}.{table_name} "
+            f"(status, endpoint_id, created_at, response_hash, response_time) "
+            f"SELECT * FROM unnest(CAST(:status AS VARCHAR[]), CAST(:endpoint_id AS INTEGER[]), "
+            f"CAST(:created_at AS TIMESTAMP[]), CAST(:response_hash AS VARCHAR[]), "
+            f"CAST(:response_time AS INTEGER[]));"
+        )
+
+    @classmethod
+    def _latest_runs(cls, records: List[LogRecord]) -> dict:
+        """
+        Per endpoint: the latest record, the length and start of the trailing run of identical statuses and whether
+        that run spans the whole batch, which is all the endpoint_status upsert needs.
+        """
+        runs = {}
+        for record in sorted(records, key=lambda r: r.created_at):
+            run = runs.get(record.endpoint_id)
+            if run and run["status"] == record.status:
+                run["length"] += 1
+            else:
+                run = {"status": record.status, "length": 1, "started_at": record.created_at,
+                       "covers_batch": run is None}
+                runs[record.endpoint_id] = run
+            run["latest"] = record
+        return runs
+
+    async def _upsert_endpoint_status(self, records: List[LogRecord]):
+        runs = self._latest_runs(records)
+        upsert_query = (
+            f"WITH batch AS ("
+            f"SELECT * FROM unnest(CAST(:endpoint_id AS INTEGER[]), CAST(:status AS VARCHAR[]), "
+            f"CAST(:checked_at AS TIMESTAMP[]), CAST(:response_time AS INTEGER[]), CAST(:run_length AS INTEGER[]), "
+            f"CAST(:run_started_at AS TIMESTAMP[]), CAST(:covers_batch AS BOOLEAN[])) "
+            f"AS b(endpoint_id, status, checked_at, response_time, run_length, run_started_at, covers_batch)) "
+            f"INSERT INTO {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoint_status AS s "
+            f"(endpoint_id, status, last_checked_at, response_time, consecutive_failures, changed_at) "
+            f"SELECT b.endpoint_id, b.status, b.checked_at, b.response_time, "
+            f"CASE WHEN b.status = :ok THEN 0 "
+            f"WHEN b.covers_batch AND p.status = b.status THEN p.consecutive_failures + b.run_length "
+            f"ELSE b.run_length END, "
+            f"CASE WHEN b.covers_batch AND p.status = b.status THEN p.changed_at ELSE b.run_started_at END "
+            f"FROM batch b "
+            f"LEFT JOIN {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoint_status p ON p.endpoint_id = b.endpoint_id "
+            f"ON CONFLICT (endpoint_id) DO UPDATE SET "
+            f"status = EXCLUDED.status, last_checked_at = EXCLUDED.last_checked_at, "
+            f"response_time = EXCLUDED.response_time, consecutive_failures = EXCLUDED.consecutive_failures, "
+            f"changed_at = EXCLUDED.changed_at "
+            f"WHERE s.last_checked_at IS NULL OR s.last_checked_at <= EXCLUDED.last_checked_at "
+            f"RETURNING endpoint_id, status, changed_at, consecutive_failures;"
+        )
+
+        result = await self.db.execute(text(upsert_query), {
+            "ok": ProbeStatus.OK.value,
+            "endpoint_id": list(runs),
+            "status": [run["status"] for run in runs.values()],
+            "checked_at": [run["latest"].created_at for run in runs.values()],
+            "response_time": [run["latest"].response_time for run in runs.values()],
+            "run_length": [run["length"] for run in runs.values()],
+            "run_started_at": [run["started_at"] for run in runs.values()],
+            "covers_batch": [run["covers_batch"] for run in runs.values()]
+        })
+        return result.all()
+
+    @classmethod
+    def _rollup_buckets(cls, records: List[LogRecord], granularity: RollupGranularity) -> dict:
+        """Aggregate a batch per (endpoint, bucket) the same way the rollup tables aggregate all results."""
+        buckets = {}
+        for record in records:
+            key = (record.endpoint_id, bucket_start(record.created_at, ROLLUP_BUCKET_SIZES[granularity]))
+            bucket = buckets.setdefault(key, {"ok_count": 0, "error_count": 0, "min_response_time": None,
+                                              "max_response_time": None, "sum_response_time": 0,
+                                              "last_error_at": None, "last_error": None})
+
+            if record.status == ProbeStatus.OK.value:
+                bucket["ok_count"] += 1
+            else:
+                bucket["error_count"] += 1
+                if not bucket["last_error_at"] or record.created_at >= bucket["last_error_at"]:
+                    bucket["last_error_at"] = record.created_at
+                    bucket["last_error"] = {"status": record.status, "created_at": record.created_at.isoformat(),
+                                            "response": record.response, "response_time": record.response_time}
+
+            if record.response_time is not None:
+                bucket["sum_response_time"] += record.response_time
+                if bucket["min_response_time"] is None or record.response_time < bucket["min_response_time"]:
+                    bucket["min_response_time"] = record.response_time
+                if bucket["max_response_time"] is None or record.response_time > bucket["max_response_time"]:
+                    bucket["max_response_time"] = record.response_time
+        return buckets
+
+    async def _upsert_rollups(self, records: List[LogRecord]):
+        for granularity, table_name in ROLLUP_TABLES.items():
+            buckets = self._rollup_buckets(records, granularity)
+            upsert_query = (
+                f"INSERT INTO {DatabaseSchemas.LOG_SCHEMA.value}.{table_name} AS r "
+                f"(endpoint_id, bucket, ok_count, error_count, worst_status, min_response_time, max_response_time, "
+                f"sum_response_time, last_error_at, last_error) "
+                f"SELECT * FROM unnest(CAST(:endpoint_id AS INTEGER[]), CAST(:bucket AS TIMESTAMP[]), "
+                f"CAST(:ok_count AS INTEGER[]), CAST(:error_count AS INTEGER[]), CAST(:worst_status AS VARCHAR[]), "
+                f"CAST(:min_response_time AS INTEGER[]), CAST(:max_response_time AS INTEGER[]), "
+                f"CAST(:sum_response_time AS BIGINT[]), CAST(:last_error_at AS TIMESTAMP[]), "
+                f"CAST(:last_error AS JSONB[])) "
+                f"ON CONFLICT (endpoint_id, bucket) DO UPDATE SET "
+                f"ok_count = r.ok_count + EXCLUDED.ok_count, "
+                f"error_count = r.error_count + EXCLUDED.error_count, "
+                f"worst_status = CASE WHEN r.error_count + EXCLUDED.error_count > 0 THEN :error ELSE :ok END, "
+                f"min_response_time = LEAST(r.min_response_time, EXCLUDED.min_response_time), "
+                f"max_response_time = GREATEST(r.max_response_time, EXCLUDED.max_response_time), "
+                f"sum_response_time = r.sum_response_time + EXCLUDED.sum_response_time, "
+                f"last_error = CASE WHEN EXCLUDED.last_error_at >= r.last_error_at OR r.last_error_at IS NULL "
+                f"THEN coalesce(EXCLUDED.last_error, r.last_error) ELSE r.last_error END, "
+                f"last_error_at = GREATEST(r.last_error_at, EXCLUDED.last_error_at);"
+            )
+
+            await self.db.execute(text(upsert_query), {
+                "ok": ProbeStatus.OK.value,
+                "error": ProbeStatus.ERROR.value,
+                "endpoint_id": [endpoint_id for endpoint_id, _ in buckets],
+                "bucket": [bucket for _, bucket in buckets],
+                "ok_count": [bucket["ok_count"] for bucket in buckets.values()],
+                "error_count": [bucket["error_count"] for bucket in buckets.values()],
+                "worst_status": [ProbeStatus.ERROR.value if bucket["error_count"] else ProbeStatus.OK.value
+                                 for bucket in buckets.values()],
+                "min_response_time": [bucket["min_response_time"] for bucket in buckets.values()],
+                "max_response_time": [bucket["max_response_time"] for bucket in buckets.values()],
+                "sum_response_time": [bucket["sum_response_time"] for bucket in buckets.values()],
+                "last_error_at": [bucket["last_error_at"] for bucket in buckets.values()],
+                "last_error": [json.dumps(bucket["last_error"]) if bucket["last_error"] else None
+                               for bucket in buckets.values()]
+            })
+
+    @classmethod
+    def _response_hash(cls, response: Optional[dict]) -> Optional[str]:
+        if response is None:
+            return None
+        canonical = json.dumps(response, sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+    async def _upsert_responses(self, records: List[LogRecord]):
+        """
+        Store each distinct response of a batch once. Known responses are left alone, except for refreshing
+        last_seen_at once a day so retention can tell which are still referenced.
+        """
+        responses = {}
+        for record in records:
+            response_hash = self._response_hash(record.response)
+            if response_hash:
+                responses[response_hash] = record.response
+        if not responses:
+            return
+
+        # Sorted so concurrent writers lock the same rows in the same order
+        hashes = sorted(responses)
+        upsert_query = (
+            f"INSERT INTO {RESPONSES_TABLE} AS r (hash, response, last_seen_at) "
+            f"SELECT hash, response, CAST(:seen_at AS TIMESTAMP) "
+            f"FROM unnest(CAST(:hash AS VARCHAR[]), CAST(:response AS JSONB[])) AS b(hash, response) "
+            f"ON CONFLICT (hash) DO UPDATE SET last_seen_at = EXCLUDED.last_seen_at "
+            f"WHERE r.last_seen_at < EXCLUDED.last_seen_at - interval '1 day';"
+        )
+        await self.db.execute(text(upsert_query), {
+            "seen_at": max(record.created_at for record in records),
+            "hash": hashes,
+            "response": [json.dumps(responses[response_hash]) for response_hash in hashes]
+        })
+
+    async def delete_responses_before(self, cutoff: datetime, batch_size: int) -> int:
+        """Delete the stored responses last seen before the cutoff in batches, like delete_logs_before."""
+        delete_query = (
+            f"DELETE FROM {RESPONSES_TABLE} WHERE hash IN ("
+            f"SELECT hash FROM {RESPONSES_TABLE} WHERE last_seen_at < :cutoff LIMIT :batch_size);"
+        )
+
+        deleted = 0
+        while True:
+            async with self.session():
+                try:
+                    result = await self.db.execute(text(delete_query), {"cutoff": cutoff, "batch_size": batch_size})
+                    await self.db.commit()
+                except Exception as e:
+                    await self.db.rollback()
+                    raise e
+
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
+
+    @classmethod
+    def _collapse_runs(cls, records: List[LogRecord], heartbeat: timedelta) -> dict:
+        """
+        Per endpoint, the runs of identical statuses in a batch, oldest first. A run is closed once it spans the
+        heartbeat interval, so an endpoint whose status never changes still writes a row every now and then.
+        """
+        runs = defaultdict(list)
+        for record in sorted(records, key=lambda r: r.created_at):
+            endpoint_runs = runs[record.endpoint_id]
+            run = endpoint_runs[-1] if endpoint_runs else None
+            if not run or run["status"] != record.status or record.created_at - run["first_seen"] >= heartbeat:
+                run = {"status": record.status, "first_seen": record.created_at, "count": 0,
+                       "min_response_time": None, "max_response_time": None, "sum_response_time": 0,
+                       "response": record.response}
+                endpoint_runs.append(run)
+
+            run["last_seen"] = record.created_at
+            run["count"] += 1
+            if record.response_time is not None:
+                run["sum_response_time"] += record.response_time
+                if run["min_response_time"] is None or record.response_time < run["min_response_time"]:
+                    run["min_response_time"] = record.response_time
+                if run["max_response_time"] is None or record.response_time > run["max_response_time"]:
+                    run["max_response_time"] = record.response_time
+        return runs
+
+    async def _insert_runs(self, records: List[LogRecord]):
+        """
+        Extend the open run of each endpoint with the first run of the batch where the status is unchanged and the
+        heartbeat interval not yet reached, then insert every other run as a new row.
+        """
+        heartbeat = timedelta(seconds=int(log_config["heartbeat_interval"]))
+        runs = self._collapse_runs(records, heartbeat)
+        first_runs = {endpoint_id: endpoint_runs[0] for endpoint_id, endpoint_runs in runs.items()}
+
+        extend_query = (
+            f"WITH batch AS ("
+            f"SELECT * FROM unnest(CAST(:endpoint_id AS INTEGER[]), CAST(:status AS VARCHAR[]), "
+            f"CAST(:first_seen AS TIMESTAMP[]), CAST(:last_seen AS TIMESTAMP[]), CAST(:count AS INTEGER[]), "
+            f"CAST(:min_response_time AS INTEGER[]), CAST(:max_response_time AS INTEGER[]), "
+            f"CAST(:sum_response_time AS BIGINT[])) "
+            f"AS b(endpoint_id, status, first_seen, last_seen, count, min_response_time, max_response_time, "
+            f"sum_response_time)), "
+            f"latest AS ("
+            f"SELECT l.* FROM batch b CROSS JOIN LATERAL ("
+            f"SELECT id, endpoint_id, status, first_seen, last_seen FROM {RUNS_TABLE} r "
+            f"WHERE r.endpoint_id = b.endpoint_id ORDER BY first_seen DESC, id DESC LIMIT 1) l) "
+            f"UPDATE {RUNS_TABLE} r SET "
+            f"last_seen = b.last_seen, count = r.count + b.count, "
+            f"min_response_time = LEAST(r.min_response_time, b.min_response_time), "
+            f"max_response_time = GREATEST(r.max_response_time, b.max_response_time), "
+            f"sum_response_time = r.sum_response_time + b.sum_response_time "
+            f"FROM batch b JOIN latest l ON l.endpoint_id = b.endpoint_id "
+            f"WHERE r.id = l.id AND l.status = b.status AND l.last_seen <= b.first_seen "
+            f"AND b.last_seen - l.first_seen < CAST(:heartbeat AS INTERVAL) "
+            f"RETURNING r.endpoint_id;"
+        )
+        result = await self.db.execute(text(extend_query), {
+            "heartbeat": heartbeat,
+            "endpoint_id": list(first_runs),
+            "status": [run["status"] for run in first_runs.values()],
+            "first_seen": [run["first_seen"] for run in first_runs.values()],
+            "last_seen": [run["last_seen"] for run in first_runs.values()],
+            "count": [run["count"] for run in first_runs.values()],
+            "min_response_time": [run["min_response_time"] for run in first_runs.values()],
+            "max_response_time": [run["max_response_time"] for run in first_runs.values()],
+            "sum_response_time": [run["sum_response_time"] for run in first_runs.values()]
+        })
+        extended_ids = set(result.scalars().all())
+
+        new_runs = [(endpoint_id, run) for endpoint_id, endpoint_runs in runs.items()
+                    for index, run in enumerate(endpoint_runs) if index or endpoint_id not in extended_ids]
+        if not new_runs:
+            return
+
+        insert_query = (
+            f"INSERT INTO {RUNS_TABLE} "
+            f"(endpoint_id, status, first_seen, last_seen, count, min_response_time, max_response_time, "
+            f"sum_response_time, response_hash) "
+            f"SELECT * FROM unnest(CAST(:endpoint_id AS INTEGER[]), CAST(:status AS VARCHAR[]), "
+            f"CAST(:first_seen AS TIMESTAMP[]), CAST(:last_seen AS TIMESTAMP[]), CAST(:count AS INTEGER[]), "
+            f"CAST(:min_response_time AS INTEGER[]), CAST(:max_response_time AS INTEGER[]), "
+            f"CAST(:sum_response_time AS BIGINT[]), CAST(:response_hash AS VARCHAR[]));"
+        )
+        await self.db.execute(text(insert_query), {
+            "endpoint_id": [endpoint_id for endpoint_id, _ in new_runs],
+            "status": [run["status"] for _, run in new_runs],
+            "first_seen": [run["first_seen"] for _, run in new_runs],
+            "last_seen": [run["last_seen"] for _, run in new_runs],
+            "count": [run["count"] for _, run in new_runs],
+            "min_response_time": [run["min_response_time"] for _, run in new_runs],
+            "max_response_time": [run["max_response_time"] for _, run in new_runs],
+            "sum_response_time": [run["sum_response_time"] for _, run in new_runs],
+            "response_hash": [self._response_hash(run["response"]) for _, run in new_runs]
+        })
+
+    async def _insert_results(self, records: List[LogRecord]):
+        records_by_table = defaultdict(list)
+        for record in records:
+            if log_config["storage"] == LogStorage.PARTITIONED.value:
+                records_by_table[PARTITIONED_LOG_TABLE].append(record)
+            else:
+                records_by_table[self._sanitize_table_name(record.log_table)].append(record)
+
+        for table_name, table_records in records_by_table.items():
+            await self.db.execute(text(self._insert_query(table_name)), {
+                "status": [record.status for record in table_records],
+                "endpoint_id": [record.endpoint_id for record in table_records],
+                "created_at": [record.created_at for record in table_records],
+                "response_hash": [self._response_hash(record.response) for record in table_records],
+                "response_time": [record.response_time for record in table_records]
+            })
+
+    @classmethod
+    def _notify_payloads(cls, events: List[dict]) -> List[str]:
+        """Pack events into as few JSON arrays as fit in a NOTIFY payload."""
+        payloads, chunk, size = [], [], 0
+        for event in (json.dumps(event) for event in events):
+            if chunk and size + len(event) + 1 > NOTIFY_PAYLOAD_LIMIT:
+                payloads.append(f"[{','.join(chunk)}]")
+                chunk, size = [], 0
+            chunk.append(event)
+            size += len(event) + 1
+        if chunk:
+            payloads.append(f"[{','.join(chunk)}]")
+        return payloads
+
+    async def _notify_events(self, records: List[LogRecord], statuses: list):
+        """
+        Publish the status transitions of a batch, and its results if enabled, to every worker. Notifications are
+        delivered when the transaction commits, so subscribers never hear about results that were rolled back.
+        """
+        batch_started_at = {}
+        for record in records:
+            if record.endpoint_id not in batch_started_at or record.created_at < batch_started_at[record.endpoint_id]:
+                batch_started_at[record.endpoint_id] = record.created_at
+
+        # The status changed within the batch when its current run started in it
+        events = [{"type": "status", "endpoint_id": row.endpoint_id, "status": row.status,
+                   "changed_at": row.changed_at.isoformat(), "consecutive_failures": row.consecutive_failures}
+                  for row in statuses if row.changed_at and row.changed_at >= batch_started_at[row.endpoint_id]]
+        if probe_config["publish_results"]:
+            events += [{"type": "result", "endpoint_id": record.endpoint_id, "status": record.status,
+                        "created_at": record.created_at.isoformat(), "response_time": record.response_time}
+                       for record in sorted(records, key=lambda r: r.created_at)]
+        if not events:
+            return
+
+        await self.db.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS TEXT[])) "
+                                   "AS payload"), {
+            "channel": NotifyChannels.PROBE_EVENTS.value,
+            "payloads": self._notify_payloads(events)
+        })
+
+    async def _existing_endpoint_shards(self, endpoint_ids: List[int]) -> Dict[int, Optional[int]]:
+        """
+        Shard of each endpoint that still exists, so results buffered for an endpoint deleted in the meantime are
+        dropped, and results of an endpoint moved by a rebalance follow it.
+        """
+        select_query = (
+            f"SELECT id, shard FROM {DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints "
+            f"WHERE id = ANY(CAST(:ids AS INTEGER[]))"
+        )
+        if log_config["storage"] == LogStorage.TABLE.value:
+            # Only the tables of the primary can be looked up here
+            select_query += (f" AND (shard IS NOT NULL "
+                             f"OR to_regclass('{DatabaseSchemas.LOG_SCHEMA.value}.' || log_table) IS NOT NULL)")
+
+        result = await self.db.execute(text(select_query), {"ids": endpoint_ids})
+        return {row.id: row.shard for row in result}
+
+    async def _insert_raw_logs(self, records: List[LogRecord]):
+        await self._upsert_responses(records)
+        if log_config["storage"] == LogStorage.RUNS.value:
+            await self._insert_runs(records)
+        else:
+            await self._insert_results(records)
+
+    @classmethod
+    def _batch_key(cls, records: List[LogRecord]) -> str:
+        """Identity of a set of results, the same however often it is written."""
+        keys = sorted(f"{record.endpoint_id}/{record.created_at.isoformat()}/{record.status}" for record in records)
+        return hashlib.blake2b("|".join(keys).encode(), digest_size=16).hexdigest()
+
+    async def _stage_shard_logs(self, records: List[LogRecord]):
+        """
+        Insert the raw results of endpoints on this DAO's shard, with the responses they need, without committing.
+        A batch this shard has already applied is skipped, since its runs would otherwise be counted twice.
+        """
+        applied = await self.db.execute(text(
+            f"INSERT INTO {SHARD_BATCHES} (key, applied_at) VALUES (:key, :applied_at) "
+            f"ON CONFLICT (key) DO NOTHING RETURNING key"
+        ), {"key": self._batch_key(records), "applied_at": datetime.now()})
+        if applied.first():
+            await self._insert_raw_logs(records)
+
+    async def delete_shard_batches_before(self, cutoff: datetime) -> int:
+        """Forget the batches applied before the cutoff, which are long past being written again."""
+        async with self.session():
+            try:
+                result = await self.db.execute(text(f"DELETE FROM {SHARD_BATCHES} WHERE applied_at < :cutoff"),
+                                               {"cutoff": cutoff})
+                await self.db.commit()
+                return result.rowcount
+            except Exception as e:
+                await self.db.rollback()
+                raise e
+
+    async def _stage_raw_logs(self, records: List[LogRecord], shard_sessions: AsyncExitStack,
+                              shard_daos: List["LogTableDAO"]) -> List[LogRecord]:
+        """
+        Insert the raw results of the endpoints that still exist, on the primary and on each shard, leaving every
+        transaction open. The DAOs of the shards written to are added to shard_daos. Returns the records kept.
+        """
+        shards = await self._existing_endpoint_shards(list({record.endpoint_id for record in records}))
+        records = [record for record in records if record.endpoint_id in shards]
+
+        records_by_shard = defaultdict(list)
+        for record in records:
+            records_by_shard[shards[record.endpoint_id]].append(record)
+        for shard, shard_records in records_by_shard.items():
+            if shard is None:
+                await self._insert_raw_logs(shard_records)
+                continue
+
+            shard_dao = self.for_shard(shard)
+            await shard_sessions.enter_async_context(shard_dao.session())
+            shard_daos.append(shard_dao)
+            await shard_dao._stage_shard_logs(shard_records)
+        return records
+
+    async def insert_logs(self, records: List[LogRecord]):
+        """
+        Insert probe results inside a single transaction: the distinct responses, then one multi-row INSERT per log
+        table or a single one into the partitioned table, plus the upserts of the latest status and of the hourly and
+        daily rollups, and the notifications of the new statuses and results. Runs are written apart, see insert_runs.
+
+        Results of endpoints on log shards go through a transaction on each shard, committed only once every statement
+        of the batch succeeded, right before the primary's, so a failing statement leaves nothing behind anywhere.
+        Should a commit fail in between, the batch is written again and the shards that committed skip it.
+        """
+        async with AsyncExitStack() as shard_sessions, self.session():
+            shard_daos = []
+            try:
+                if log_config["storage"] == LogStorage.RUNS.value:
+                    shards = await self._existing_endpoint_shards(list({record.endpoint_id for record in records}))
+                    records = [record for record in records if record.endpoint_id in shards]
+                else:
+                    records = await self._stage_raw_logs(records, shard_sessions, shard_daos)
+                if not records:
+                    return
+
+                statuses = await self._upsert_endpoint_status(records)
+                await self._upsert_rollups(records)
+                await self._notify_events(records, statuses)
+
+                for shard_dao in shard_daos:
+                    await shard_dao.db.commit()
+                await self.db.commit()
+            except Exception as e:
+                for shard_dao in shard_daos:
+                    await shard_dao.db.rollback()
+                await self.db.rollback()
+                raise e
+
+    async def insert_runs(self, records: List[LogRecord]):
+        """
+        Extend or start the runs of probe results that insert_logs already counted. The log writer holds results
+        back for log_runs_flush_interval, so an open run is updated once per interval rather than on every flush.
+        Commits like insert_logs.
+        """
+        async with AsyncExitStack() as shard_sessions, self.session():
+            shard_daos = []
+            try:
+                await self._stage_raw_logs(records, shard_sessions, shard_daos)
+                for shard_dao in shard_daos:
+                    await shard_dao.db.commit()
+                await self.db.commit()
+            except Exception as e:
+                for shard_dao in shard_daos:
+                    await shard_dao.db.rollback()
                 await self.db.rollback()
                 raise e
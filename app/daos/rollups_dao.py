@@ -0,0 +1,56 @@
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import delete, select, tuple_
+
+from app.daos.base_dao import BaseDAO
+from app.models import db_models as model
+from app.utils.enums import RollupGranularity
+
+ROLLUP_MODELS = {
+    RollupGranularity.HOUR: model.RollupHourly,
+    RollupGranularity.DAY: model.RollupDaily,
+}
+
+
+class RollupDAO(BaseDAO):
+    async def get_by_endpoint_id(self, endpoint_id: int, granularity: RollupGranularity,
+                                 since: datetime) -> List[model.RollupMixin]:
+        """Fetch the rollups of an endpoint from the given bucket on, oldest first."""
+        rollup_model = ROLLUP_MODELS[granularity]
+        async with self.read_session():
+            result = await self.read_db.execute(select(rollup_model)
+                                                .where(rollup_model.endpoint_id == endpoint_id,
+                                                       rollup_model.bucket >= since)
+                                                .order_by(rollup_model.bucket))
+            return result.scalars().all()
+
+    async def get_by_endpoint_ids(self, endpoint_ids: List[int], granularity: RollupGranularity,
+                                  since: datetime) -> List[model.RollupMixin]:
+        """Fetch the rollups of many endpoints from the given bucket on in one query, by endpoint then bucket."""
+        rollup_model = ROLLUP_MODELS[granularity]
+        async with self.read_session():
+            result = await self.read_db.execute(select(rollup_model)
+                                                .where(rollup_model.endpoint_id.in_(endpoint_ids),
+                                                       rollup_model.bucket >= since)
+                                                .order_by(rollup_model.endpoint_id, rollup_model.bucket))
+            return result.scalars().all()
+
+    async def delete_before(self, granularity: RollupGranularity, cutoff: datetime, batch_size: int) -> int:
+        """Delete rollups of all endpoints older than the cutoff in batches, committing after each batch."""
+        rollup_model = ROLLUP_MODELS[granularity]
+        expired = (select(rollup_model.endpoint_id, rollup_model.bucket)
+                   .where(rollup_model.bucket < cutoff)
+                   .limit(batch_size))
+
+        deleted = 0
+        while True:
+            async with self.session():
+                result = await self.db.execute(delete(rollup_model)
+                                               .where(tuple_(rollup_model.endpoint_id, rollup_model.bucket)
+                                                      .in_(expired)))
+                await self.db.commit()
+
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
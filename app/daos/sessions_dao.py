@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.daos.base_dao import BaseDAO
+from app.models import db_models as model
+from app.utils.enums import NotifyChannels
+
+
+class SessionDAO(BaseDAO):
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Fetch the data of a session that has not expired yet."""
+        async with self.session():
+            result = await self.db.execute(select(model.Sessions.data)
+                                           .where(model.Sessions.id == session_id,
+                                                  model.Sessions.expires_at > datetime.now()))
+            return result.scalar()
+
+    async def save(self, session_id: str, data: dict, expires_at: datetime):
+        """Create or replace a session."""
+        statement = insert(model.Sessions).values(id=session_id, data=data, expires_at=expires_at)
+        async with self.session():
+            await self.db.execute(statement.on_conflict_do_update(
+                index_elements=[model.Sessions.id],
+                set_={"data": statement.excluded.data, "expires_at": statement.excluded.expires_at}
+            ))
+            await self.db.commit()
+
+    async def delete(self, session_id: str):
+        """Delete a session and tell the other workers to drop it from their caches."""
+        async with self.session():
+            await self.db.execute(delete(model.Sessions).where(model.Sessions.id == session_id))
+            await self.db.execute(select(func.pg_notify(NotifyChannels.SESSION_CHANGES.value, session_id)))
+            await self.db.commit()
+
+    async def delete_expired(self, batch_size: int) -> int:
+        """Delete expired sessions in batches, committing after each batch."""
+        expired = (select(model.Sessions.id)
+                   .where(model.Sessions.expires_at <= datetime.now())
+                   .limit(batch_size))
+
+        deleted = 0
+        while True:
+            async with self.session():
+                result = await self.db.execute(delete(model.Sessions).where(model.Sessions.id.in_(expired)))
+                await self.db.commit()
+
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
@@ -1,12 +1,13 @@
 from typing import List
 
 from psycopg2 import errorcodes
-from sqlalchemy import select, delete, update
+from sqlalchemy import func, select, delete, update
 from sqlalchemy.exc import IntegrityError
 
+from app.daos.base_dao import BaseDAO
 from app.models import db_models as model
 from app.schemas.users_sch import CreateUserDB
-from app.utils import database
+from app.utils.enums import NotifyChannels
 
 
 class DuplicateUserError(Exception):
@@ -14,25 +15,26 @@ class DuplicateUserError(Exception):
         self.detail = detail
 
 
-class UserDAO:
-    def __init__(self):
-        self.db = database.SessionLocal()
+class UserDAO(BaseDAO):
+    async def _notify_change(self, email: str):
+        """Tell the other workers about a change to the user, delivered when the transaction commits."""
+        await self.db.execute(select(func.pg_notify(NotifyChannels.USER_CHANGES.value, email)))
 
     async def get_all(self) -> List[model.Users]:
         """Fetch all users."""
-        async with self.db:
+        async with self.session():
             result = await self.db.execute(select(model.Users).order_by(model.Users.first_name))
             return result.scalars().all()
 
     async def get_by_id(self, user_id: int) -> model.Users:
         """Fetch a specific user by its ID."""
-        async with self.db:
+        async with self.session():
             result = await self.db.execute(select(model.Users).where(model.Users.id == user_id))
             return result.scalars().first()
 
     async def get_by_email(self, email: str) -> model.Users:
         """Fetch a specific user by its Email."""
-        async with self.db:
+        async with self.session():
             result = await self.db.execute(select(model.Users).where(model.Users.email == email))
             return result.scalars().first()
 
@@ -47,7 +49,7 @@ class UserDAO:
             access_level=user_data.access_level
         )
         try:
-            async with self.db:
+            async with self.session():
                 self.db.add(user)
                 await self.db.commit()
                 return user
@@ -63,14 +65,27 @@ class UserDAO:
 
     async def update(self, user_id: int, updated_data) -> model.Users:
         """Update an existing user."""
-        async with self.db:
-            await self.db.execute(update(model.Users).where(model.Users.id == user_id).values(**updated_data))
+        async with self.session():
+            # Sessions refer to the user by the email it had before the update, which a subquery in RETURNING
+            # still sees since it reads the snapshot taken before the statement
+            previous_email = (select(model.Users.email).where(model.Users.id == user_id)
+                              .scalar_subquery().label("previous_email"))
+            result = await self.db.execute(update(model.Users).where(model.Users.id == user_id)
+                                           .values(**updated_data)
+                                           .returning(model.Users, previous_email)
+                                           .execution_options(populate_existing=True))
+            row = result.first()
+            if row:
+                await self._notify_change(row.previous_email)
             await self.db.commit()
-
-        return await self.get_by_id(user_id)
+            return row[0] if row else None
 
     async def delete(self, user_id: int):
         """Delete an user."""
-        async with self.db:
-            await self.db.execute(delete(model.Users).where(model.Users.id == user_id))
+        async with self.session():
+            result = await self.db.execute(delete(model.Users).where(model.Users.id == user_id)
+                                           .returning(model.Users.email))
+            email = result.scalar()
+            if email:
+                await self._notify_change(email)
             await self.db.commit()
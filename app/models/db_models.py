@@ -1,13 +1,21 @@
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
 
-from sqlalchemy import Column, Integer, String, TIMESTAMP, SmallInteger, Table, ForeignKey
+from sqlalchemy import BigInteger, Column, Index, Integer, String, TIMESTAMP, SmallInteger, Table, ForeignKey, text
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.sql import func
-from sqlalchemy.sql.ddl import CreateTable
+from sqlalchemy.sql.ddl import CreateIndex, CreateTable
 
-from app.utils.database import Base, SessionLocal
+from app.utils.database import Base, SessionLocal, log_shards
 from app.utils.enums import DatabaseSchemas
 
+PARTITIONED_LOG_TABLE = "probe_results"
+# Catches results outside every daily partition, should maintenance fall behind or the clock jump
+DEFAULT_LOG_PARTITION = f"{PARTITIONED_LOG_TABLE}_default"
+# Batches of results applied on a log shard, so a batch written again after a failure is only applied once
+SHARD_BATCHES_TABLE = "shard_batches"
+
 
 class Users(Base):
     __tablename__ = "users"
@@ -34,6 +42,16 @@ class Users(Base):
         }
 
 
+class Sessions(Base):
+    """Server-side sessions, used when app_session_store is database. The cookie only holds the ID."""
+    __tablename__ = "sessions"
+    __table_args__ = {'schema': DatabaseSchemas.CONFIG_SCHEMA.value}
+
+    id = Column(String, primary_key=True)
+    data = Column(JSONB)
+    expires_at = Column(TIMESTAMP, index=True)
+
+
 class Auth(Base):
     __tablename__ = "auth"
     __table_args__ = {'schema': DatabaseSchemas.CONFIG_SCHEMA.value}
@@ -70,9 +88,25 @@ class Endpoints(Base):
     status_code = Column(Integer)
     response = Column(JSONB)
     type = Column(String)
+    jitter = Column(SmallInteger, nullable=True)
+    retention_days = Column(SmallInteger, nullable=True)
+    # Log shard holding the endpoint's results, NULL for the primary
+    shard = Column(SmallInteger, nullable=True)
     created_at = Column(TIMESTAMP, default=func.now())
 
     status: Optional[str] = None
+    last_checked_at: Optional[datetime] = None
+    response_time: Optional[int] = None
+    consecutive_failures: Optional[int] = None
+
+    def with_status(self, endpoint_status: Optional["EndpointStatus"]) -> "Endpoints":
+        """Attach the latest probe outcome kept in config.endpoint_status."""
+        if endpoint_status:
+            self.status = endpoint_status.status
+            self.last_checked_at = endpoint_status.last_checked_at
+            self.response_time = endpoint_status.response_time
+            self.consecutive_failures = endpoint_status.consecutive_failures
+        return self
 
     def as_dict(self):
         return {
@@ -87,28 +121,319 @@ class Endpoints(Base):
             'status_code': self.status_code,
             'response': self.response,
             'type': self.type,
+            'jitter': self.jitter,
+            'retention_days': self.retention_days,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'status': self.status
+            'status': self.status,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
+            'response_time': self.response_time,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+
+class EndpointStatus(Base):
+    __tablename__ = "endpoint_status"
+    __table_args__ = {'schema': DatabaseSchemas.CONFIG_SCHEMA.value}
+
+    endpoint_id = Column(Integer, ForeignKey(f"{DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints.id", ondelete='CASCADE'),
+                         primary_key=True)
+    status = Column(String)
+    last_checked_at = Column(TIMESTAMP)
+    response_time = Column(Integer)
+    consecutive_failures = Column(Integer, default=0)
+    changed_at = Column(TIMESTAMP)
+
+    def as_dict(self):
+        return {
+            'endpoint_id': self.endpoint_id,
+            'status': self.status,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
+            'response_time': self.response_time,
+            'consecutive_failures': self.consecutive_failures,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None
+        }
+
+
+class RollupMixin:
+    """Probe results of one endpoint aggregated per time bucket."""
+    endpoint_id = Column(Integer, ForeignKey(f"{DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints.id", ondelete='CASCADE'),
+                         primary_key=True)
+    bucket = Column(TIMESTAMP, primary_key=True)
+    ok_count = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    worst_status = Column(String)
+    min_response_time = Column(Integer)
+    max_response_time = Column(Integer)
+    sum_response_time = Column(BigInteger, default=0)
+    last_error_at = Column(TIMESTAMP)
+    last_error = Column(JSONB)
+
+    @classmethod
+    def bucket_as_dict(cls, bucket):
+        """Format a rollup row, or any row with the same columns aggregated on the fly."""
+        count = (bucket.ok_count or 0) + (bucket.error_count or 0)
+        return {
+            'bucket': bucket.bucket.isoformat() if bucket.bucket else None,
+            'status': bucket.worst_status,
+            'ok_count': bucket.ok_count,
+            'error_count': bucket.error_count,
+            'uptime': round(bucket.ok_count / count, 4) if count else None,
+            'min_response_time': bucket.min_response_time,
+            'avg_response_time': round(bucket.sum_response_time / count) if count else None,
+            'max_response_time': bucket.max_response_time,
+            'last_error': bucket.last_error
         }
 
+    def as_dict(self):
+        return self.bucket_as_dict(self)
+
+
+class RollupHourly(RollupMixin, Base):
+    __tablename__ = "rollup_hourly"
+    __table_args__ = {'schema': DatabaseSchemas.LOG_SCHEMA.value}
+
+
+class RollupDaily(RollupMixin, Base):
+    __tablename__ = "rollup_daily"
+    __table_args__ = {'schema': DatabaseSchemas.LOG_SCHEMA.value}
+
+
+class ProbeRuns(Base):
+    """Consecutive identical probe outcomes of one endpoint, stored as a single row by the runs log storage."""
+    __tablename__ = "probe_runs"
+    __table_args__ = (
+        Index("probe_runs_endpoint_id_first_seen_idx", "endpoint_id", "first_seen", "id"),
+        {'schema': DatabaseSchemas.LOG_SCHEMA.value}
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    endpoint_id = Column(Integer, ForeignKey(f"{DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints.id", ondelete='CASCADE'),
+                         nullable=False)
+    status = Column(String)
+    first_seen = Column(TIMESTAMP, nullable=False)
+    last_seen = Column(TIMESTAMP, nullable=False)
+    count = Column(Integer, default=1)
+    min_response_time = Column(Integer)
+    max_response_time = Column(Integer)
+    sum_response_time = Column(BigInteger, default=0)
+    # Response of the first result of the run, stored in log.responses
+    response = Column(JSONB)
+    response_hash = Column(String)
+
+
+class Responses(Base):
+    """Response bodies shared by all results, keyed by the hash of their content."""
+    __tablename__ = "responses"
+    __table_args__ = {'schema': DatabaseSchemas.LOG_SCHEMA.value}
+
+    hash = Column(String, primary_key=True)
+    response = Column(JSONB)
+    # Refreshed at most once a day, so retention can tell which bodies are no longer referenced
+    last_seen_at = Column(TIMESTAMP, index=True)
+
+
+def log_table_index_name(table_name: str) -> str:
+    return f"{table_name}_created_at_idx"
 
-async def create_log_table(table_name: str):
+
+async def create_log_table(table_name: str, shard: Optional[int] = None):
+    # Shards have no config schema to reference, their tables are dropped along with the endpoint instead
+    endpoint_reference = [] if shard is not None else [
+        ForeignKey(f"{DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints.id", ondelete='CASCADE')
+    ]
     log_table = Table(
         table_name, Base.metadata,
         Column('id', Integer, primary_key=True, autoincrement=True),
         Column('status', String),
-        Column('endpoint_id', Integer,
-               ForeignKey(f"{DatabaseSchemas.CONFIG_SCHEMA.value}.endpoints.id", ondelete='CASCADE'), nullable=True),
+        Column('endpoint_id', Integer, *endpoint_reference, nullable=True),
         Column('created_at', TIMESTAMP, default=func.now()),
         Column('response', JSONB),
+        Column('response_hash', String),
         Column('response_time', Integer),
         schema=DatabaseSchemas.LOG_SCHEMA.value
     )
+    # Serves time ranges, the latest result and keyset pagination on (created_at, id) without sequential scans
+    created_at_index = Index(log_table_index_name(table_name), log_table.c.created_at, log_table.c.id)
 
-    # Generate the SQL statement for table creation
-    create_table_stmt = CreateTable(log_table)
+    # Generate the SQL statement for table creation, which a shard rebalance may repeat
+    create_table_stmt = CreateTable(log_table, if_not_exists=True)
 
     # Use the async session to execute the table creation
-    async with SessionLocal() as session:
+    async with log_shards.session(shard) as session:
         await session.execute(create_table_stmt)
+        await session.execute(CreateIndex(created_at_index, if_not_exists=True))
+        await session.commit()
+
+
+async def create_shard_log_tables(shard: int):
+    """
+    Create the log schema and its shared tables on a shard, without the references to the config schema, plus the
+    ledger of applied batches.
+    """
+    async with log_shards.session(shard) as session:
+        await session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {DatabaseSchemas.LOG_SCHEMA.value}"))
+        for table in (ProbeRuns.__table__, Responses.__table__):
+            await session.execute(CreateTable(table, include_foreign_key_constraints=[], if_not_exists=True))
+            for index in table.indexes:
+                await session.execute(CreateIndex(index, if_not_exists=True))
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DatabaseSchemas.LOG_SCHEMA.value}.{SHARD_BATCHES_TABLE} ("
+            f"key VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        await session.commit()
+
+
+async def create_partitioned_log_table(shard: Optional[int] = None):
+    """Create the single log table, range-partitioned by day on created_at, used by the partitioned storage."""
+    create_table_sql = (
+        f"CREATE TABLE IF NOT EXISTS {DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE} ("
+        f"id BIGINT GENERATED BY DEFAULT AS IDENTITY, "
+        f"endpoint_id INTEGER NOT NULL, "
+        f"status VARCHAR, "
+        f"created_at TIMESTAMP NOT NULL DEFAULT now(), "
+        f"response JSONB, "
+        f"response_hash VARCHAR, "
+        f"response_time INTEGER, "
+        f"PRIMARY KEY (endpoint_id, created_at, id)"
+        f") PARTITION BY RANGE (created_at)"
+    )
+
+    async with log_shards.session(shard) as session:
+        await session.execute(text(create_table_sql))
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DatabaseSchemas.LOG_SCHEMA.value}.{DEFAULT_LOG_PARTITION} "
+            f"PARTITION OF {DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE} DEFAULT"
+        ))
+        await session.commit()
+
+
+def log_partition_name(day: date) -> str:
+    return f"{PARTITIONED_LOG_TABLE}_p{day.strftime('%Y%m%d')}"
+
+
+async def create_log_partitions(first_day: date, last_day: date, shard: Optional[int] = None):
+    """
+    Create the missing daily partitions of the partitioned log table between the two days, inclusive. Results of
+    those days that landed in the default partition are moved into the new partition, which Postgres requires.
+    """
+    log_table = f"{DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE}"
+    default_partition = f"{DatabaseSchemas.LOG_SCHEMA.value}.{DEFAULT_LOG_PARTITION}"
+    async with log_shards.session(shard) as session:
+        day = first_day
+        while day <= last_day:
+            partition = f"{DatabaseSchemas.LOG_SCHEMA.value}.{log_partition_name(day)}"
+            day_range = {"start": day, "end": day + timedelta(days=1)}
+            create_partition_sql = (
+                f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {log_table} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+
+            exists = await session.execute(text("SELECT to_regclass(:partition)"), {"partition": partition})
+            stranded = False
+            if not exists.scalar():
+                stranded = await session.execute(text(
+                    f"SELECT to_regclass(:default_partition) IS NOT NULL AND EXISTS ("
+                    f"SELECT 1 FROM {log_table} WHERE created_at >= :start AND created_at < :end)"
+                ), {"default_partition": default_partition, **day_range})
+                stranded = stranded.scalar()
+
+            if stranded:
+                # Writers wait until the partition exists, so no result of the day slips into the default meanwhile
+                await session.execute(text(f"LOCK TABLE {default_partition} IN SHARE ROW EXCLUSIVE MODE"))
+                await session.execute(text(
+                    f"CREATE TEMPORARY TABLE stranded_results ON COMMIT DROP AS SELECT * FROM {default_partition} "
+                    f"WHERE created_at >= :start AND created_at < :end"
+                ), day_range)
+                await session.execute(text(
+                    f"DELETE FROM {default_partition} WHERE created_at >= :start AND created_at < :end"
+                ), day_range)
+                await session.execute(text(create_partition_sql))
+                await session.execute(text(f"INSERT INTO {log_table} SELECT * FROM stranded_results"))
+                await session.execute(text("DROP TABLE stranded_results"))
+            else:
+                await session.execute(text(create_partition_sql))
+            day += timedelta(days=1)
+
+        await session.commit()
+
+
+async def drop_log_partitions_before(day: date, shard: Optional[int] = None):
+    """Detach and drop the daily partitions that end on or before the given day, each in its own transaction."""
+    select_partitions_sql = (
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "JOIN pg_namespace n ON n.oid = p.relnamespace "
+        "WHERE n.nspname = :schema AND p.relname = :parent"
+    )
+
+    async with log_shards.session(shard) as session:
+        result = await session.execute(text(select_partitions_sql), {
+            "schema": DatabaseSchemas.LOG_SCHEMA.value,
+            "parent": PARTITIONED_LOG_TABLE
+        })
+        # Partition names end in YYYYMMDD, so they sort by day
+        partitions = sorted(partition for partition in result.scalars().all()
+                            if partition != DEFAULT_LOG_PARTITION and partition < log_partition_name(day))
+
+        # The default partition is kept, only the results in it that are past the cutoff go
+        await session.execute(text(
+            f"DELETE FROM {DatabaseSchemas.LOG_SCHEMA.value}.{DEFAULT_LOG_PARTITION} WHERE created_at < :cutoff"
+        ), {"cutoff": day})
         await session.commit()
+
+    dropped = []
+    for partition in partitions:
+        async with log_shards.session(shard) as session:
+            # Give up rather than queue behind long-running queries while holding the lock on the parent table
+            await session.execute(text("SET LOCAL lock_timeout = '5s'"))
+            await session.execute(text(
+                f"ALTER TABLE {DatabaseSchemas.LOG_SCHEMA.value}.{PARTITIONED_LOG_TABLE} "
+                f"DETACH PARTITION {DatabaseSchemas.LOG_SCHEMA.value}.{partition}"
+            ))
+            await session.execute(text(f"DROP TABLE {DatabaseSchemas.LOG_SCHEMA.value}.{partition}"))
+            await session.commit()
+        dropped.append(partition)
+
+    return dropped
+
+
+async def add_response_hash_columns(lock_timeout: str = "5s") -> Tuple[List[str], List[str]]:
+    """
+    Add response_hash to the log tables that predate deduplicated responses, each in its own short transaction so
+    only one table is locked at a time. Tables busy for longer than lock_timeout are skipped and returned apart.
+    """
+    # Per-endpoint tables are named t<uuid>, see EndpointService.generate_table_name
+    select_tables_sql = (
+        "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = :schema AND c.relkind IN ('r', 'p') "
+        "AND (c.relname ~ '^t[0-9a-f_]{36}$' OR c.relname IN (:partitioned, :runs)) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attname = 'response_hash') "
+        "ORDER BY c.relname"
+    )
+
+    async with SessionLocal() as session:
+        result = await session.execute(text(select_tables_sql), {
+            "schema": DatabaseSchemas.LOG_SCHEMA.value,
+            "partitioned": PARTITIONED_LOG_TABLE,
+            "runs": ProbeRuns.__tablename__
+        })
+        tables = result.scalars().all()
+
+    upgraded, skipped = [], []
+    for table in tables:
+        async with SessionLocal() as session:
+            try:
+                await session.execute(text("SELECT set_config('lock_timeout', :lock_timeout, true)"),
+                                      {"lock_timeout": lock_timeout})
+                await session.execute(text(
+                    f"ALTER TABLE {DatabaseSchemas.LOG_SCHEMA.value}.{table} "
+                    f"ADD COLUMN IF NOT EXISTS response_hash VARCHAR"
+                ))
+                await session.commit()
+                upgraded.append(table)
+            except DBAPIError:
+                await session.rollback()
+                skipped.append(table)
+
+    return upgraded, skipped
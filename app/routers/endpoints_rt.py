@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, Request
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.endpoints_sch import CreateEndpoint, UpdateEndpoint
 from app.schemas.response_sch import Response
 from app.schemas.users_sch import UserResponse
 from app.services.auth_srv import AuthService
-from app.services.endpoints_srv import EndpointService
+from app.services.endpoints_srv import EndpointService, DEFAULT_STATUS_LIMIT, MAX_STATUS_LIMIT
+from app.utils.database import get_db, get_read_db
+from app.utils.enums import ExportFormat, UptimeBucket
 
 router = APIRouter()
 
 
-def create_endpoint_service():
-    return EndpointService()
+def create_endpoint_service(db: AsyncSession = Depends(get_db), read_db: AsyncSession = Depends(get_read_db)):
+    return EndpointService(db, read_db)
 
 
 @router.get("/endpoints", tags=["endpoints"])
@@ -19,6 +25,15 @@ async def get_all(request: Request,
     return await endpoint_service.get_all(request)
 
 
+# Declared before /endpoints/{endpoint_id}, which would otherwise match it
+@router.get("/endpoints/uptime", tags=["endpoints"])
+async def get_uptime_graphs(request: Request, endpoint_id: Optional[List[int]] = Query(None),
+                            application_id: Optional[int] = None, window: str = "72h",
+                            bucket: Optional[UptimeBucket] = None,
+                            endpoint_service: EndpointService = Depends(create_endpoint_service)) -> UserResponse:
+    return await endpoint_service.get_uptime_graphs(request, endpoint_id, application_id, window, bucket)
+
+
 @router.get("/endpoints/{endpoint_id}", tags=["endpoints"])
 async def get_by_id(endpoint_id: int, request: Request,
                     endpoint_service: EndpointService = Depends(create_endpoint_service)) -> UserResponse:
@@ -27,14 +42,29 @@ async def get_by_id(endpoint_id: int, request: Request,
 
 @router.get("/endpoints/{endpoint_id}/status", tags=["endpoints"])
 async def get_status_graph_by_id(endpoint_id: int, request: Request,
+                                 since: Optional[datetime] = Query(None, alias="from"),
+                                 until: Optional[datetime] = Query(None, alias="to"),
+                                 limit: int = Query(DEFAULT_STATUS_LIMIT, ge=1, le=MAX_STATUS_LIMIT),
+                                 cursor: Optional[str] = None, include_response: bool = False,
                                  endpoint_service: EndpointService = Depends(create_endpoint_service)) -> UserResponse:
-    return await endpoint_service.get_status_graph_by_id(request, endpoint_id)
+    return await endpoint_service.get_status_graph_by_id(request, endpoint_id, since, until, limit, cursor,
+                                                         include_response)
 
 
 @router.get("/endpoints/{endpoint_id}/uptime", tags=["endpoints"])
-async def get_status_graph_by_id(endpoint_id: int, request: Request,
+async def get_status_graph_by_id(endpoint_id: int, request: Request, window: str = "72h",
+                                 bucket: Optional[UptimeBucket] = None,
                                  endpoint_service: EndpointService = Depends(create_endpoint_service)) -> UserResponse:
-    return await endpoint_service.get_uptime_graph_by_id(request, endpoint_id)
+    return await endpoint_service.get_uptime_graph_by_id(request, endpoint_id, window, bucket)
+
+
+@router.get("/endpoints/{endpoint_id}/export", tags=["endpoints"])
+async def export_logs_by_id(endpoint_id: int, request: Request,
+                            export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+                            since: Optional[datetime] = Query(None, alias="from"),
+                            until: Optional[datetime] = Query(None, alias="to"),
+                            endpoint_service: EndpointService = Depends(create_endpoint_service)):
+    return await endpoint_service.export_logs_by_id(request, endpoint_id, export_format, since, until)
 
 
 @router.post("/endpoints", tags=["endpoints"])
@@ -0,0 +1,19 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from app.services.status_events_srv import status_events
+
+router = APIRouter()
+
+
+@router.get("/events", tags=["events"])
+async def stream_events(endpoint_id: Optional[List[int]] = Query(None), include_results: bool = False):
+    """Server-sent status transitions, and optionally every new result, of all or of the given endpoints."""
+    return StreamingResponse(
+        status_events.stream(set(endpoint_id) if endpoint_id else None, include_results),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come instead of buffering the response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
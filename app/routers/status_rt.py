@@ -1,6 +1,10 @@
+import os
+
 from fastapi import APIRouter
 
 from app.schemas.response_sch import Response
+from app.services.leader_srv import leader_election
+from app.services.probe_srv import probe_engine
 from app.utils.response import ok
 
 router = APIRouter()
@@ -9,3 +13,13 @@ router = APIRouter()
 @router.get("/status", tags=["status"])
 async def status() -> Response:
     return ok(message="Service is healthy!")
+
+
+@router.get("/status/probes", tags=["status"])
+async def probes_status() -> Response:
+    # Every worker answers with its own engine, only the elected leader's runs the probes
+    data = {"worker": os.getpid(), "leader": leader_election.is_leader, **probe_engine.metrics()}
+    if not leader_election.is_leader:
+        return ok(message="This worker does not run the probes, its metrics stay empty. Retry to reach the leader.",
+                  data=data)
+    return ok(message="Successfully provided probe engine metrics.", data=data)
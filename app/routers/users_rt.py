@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Request, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.users_sch import UserResponse, UpdateUserProfile
 from app.services.users_srv import UserService
 from app.utils.check_session import auth_required
-from app.utils.enums import SessionAttributes
+from app.utils.database import get_db
 
 router = APIRouter()
 
 
-def create_user_service():
-    return UserService()
+def create_user_service(db: AsyncSession = Depends(get_db)):
+    return UserService(db)
 
 
 @router.get("/user", tags=["users"])
@@ -23,5 +24,5 @@ async def get_user_by_id(request: Request,
 @auth_required
 async def update_user_profile(request: Request, user_data: UpdateUserProfile,
                               user_service: UserService = Depends(create_user_service)) -> UserResponse:
-    user_id = request.session.get(SessionAttributes.USER_ID.value)
+    user_id = request.state.user["id"]
     return await user_service.update_user(user_id, user_data)
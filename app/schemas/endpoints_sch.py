@@ -1,11 +1,52 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from croniter import croniter, CroniterNotAlphaError, CroniterBadCronError
+from typing import ClassVar, Optional
+from croniter import CroniterNotAlphaError, CroniterBadCronError
 
 from pydantic import BaseModel, field_validator
 
+from app.utils.cron import cron_cache
 
-class CreateEndpoint(BaseModel):
+# Largest value of the SMALLINT columns the endpoint overrides are stored in
+SMALLINT_MAX = 32767
+
+
+class EndpointValidatorUtils:
+    @classmethod
+    def validate_cron_expression(cls, value: str) -> str:
+        """Validates the cron syntax and that consecutive runs are at least 1 minute apart."""
+        if value is None:
+            return value
+
+        try:
+            next_run_1, next_run_2 = cron_cache.next_n(value, datetime.now(), 2)
+        except (CroniterNotAlphaError, CroniterBadCronError):
+            raise ValueError("Invalid cron syntax")
+
+        if next_run_2 - next_run_1 < timedelta(minutes=1):
+            raise ValueError("Cron schedule too frequent, should not be less than 1 minute apart")
+
+        return value
+
+    @classmethod
+    def validate_jitter(cls, value: Optional[int]) -> Optional[int]:
+        """Validates that the jitter window, in seconds, is not negative and fits its column."""
+        if value is not None and value < 0:
+            raise ValueError("Jitter should be a positive number of seconds or 0 to disable it")
+        if value is not None and value > SMALLINT_MAX:
+            raise ValueError(f"Jitter should not be more than {SMALLINT_MAX} seconds")
+        return value
+
+    @classmethod
+    def validate_retention_days(cls, value: Optional[int]) -> Optional[int]:
+        """Validates that the retention, in days, is not negative and fits its column."""
+        if value is not None and value < 0:
+            raise ValueError("Retention should be a positive number of days or 0 to keep logs forever")
+        if value is not None and value > SMALLINT_MAX:
+            raise ValueError(f"Retention should not be more than {SMALLINT_MAX} days")
+        return value
+
+
+class BaseEndpoint(BaseModel):
     name: str
     description: Optional[str] = None
     url: str
@@ -15,24 +56,28 @@ class CreateEndpoint(BaseModel):
     status_code: int
     response: Optional[dict] = {}
     type: str
+    jitter: Optional[int] = None
+    retention_days: Optional[int] = None
 
+
+class CreateEndpoint(BaseEndpoint):
     @field_validator('cron')
     def validate_cron_expression(cls, value):
-        try:
-            cron = croniter(value, datetime.now())
+        return EndpointValidatorUtils.validate_cron_expression(value)
 
-            next_run_1 = cron.get_next(datetime)
-            next_run_2 = cron.get_next(datetime)
+    @field_validator('jitter')
+    def validate_jitter(cls, value):
+        return EndpointValidatorUtils.validate_jitter(value)
 
-            if next_run_2 - next_run_1 < timedelta(minutes=1):
-                raise ValueError("Cron schedule too frequent, should not be less than 1 minute apart")
-
-            return value
-        except (CroniterNotAlphaError, CroniterBadCronError):
-            raise ValueError("Invalid cron syntax")
+    @field_validator('retention_days')
+    def validate_retention_days(cls, value):
+        return EndpointValidatorUtils.validate_retention_days(value)
 
 
 class UpdateEndpoint(BaseModel):
+    # Overrides of global settings, sending them as null resets them to the global default
+    CLEARABLE_FIELDS: ClassVar[set] = {"jitter", "retention_days"}
+
     name: Optional[str] = None
     description: Optional[str] = None
     url: Optional[str] = None
@@ -42,31 +87,35 @@ class UpdateEndpoint(BaseModel):
     status_code: Optional[int] = None
     response: Optional[dict] = {}
     type: Optional[str] = None
+    jitter: Optional[int] = None
+    retention_days: Optional[int] = None
 
     @field_validator('cron')
     def validate_cron_expression(cls, value):
-        try:
-            cron = croniter(value, datetime.now())
-
-            next_run_1 = cron.get_next(datetime)
-            next_run_2 = cron.get_next(datetime)
+        return EndpointValidatorUtils.validate_cron_expression(value)
 
-            if next_run_2 - next_run_1 < timedelta(minutes=1):
-                raise ValueError("Cron schedule too frequent, should not be less than 1 minute apart")
+    @field_validator('jitter')
+    def validate_jitter(cls, value):
+        return EndpointValidatorUtils.validate_jitter(value)
 
-            return value
-        except (CroniterNotAlphaError, CroniterBadCronError):
-            raise ValueError("Invalid cron syntax")
+    @field_validator('retention_days')
+    def validate_retention_days(cls, value):
+        return EndpointValidatorUtils.validate_retention_days(value)
 
 
 class CreateEndpointInDb(CreateEndpoint):
     log_table: str
+    shard: Optional[int] = None
 
 
-# Response models
-class BaseEndpointsOut(CreateEndpointInDb):
+# Response models, built from stored endpoints, so the input validators are not run again
+class BaseEndpointsOut(BaseEndpoint):
+    log_table: str
     id: int
     status: str | None
+    last_checked_at: datetime | None = None
+    response_time: int | None = None
+    consecutive_failures: int | None = None
 
 
 class EndpointsOut(BaseEndpointsOut):
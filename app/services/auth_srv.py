@@ -1,6 +1,9 @@
 import hashlib
+from typing import Optional
+
 from fastapi import Request
 from fastapi import status as Status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.daos.users_dao import UserDAO, DuplicateUserError
 from app.schemas.auth_sch import LoginUser, RegisterUser
@@ -13,8 +16,8 @@ LOGGER = Logger().start_logger()
 
 
 class AuthService:
-    def __init__(self):
-        self.user_dao = UserDAO()
+    def __init__(self, db: Optional[AsyncSession] = None):
+        self.user_dao = UserDAO(db)
 
     @classmethod
     def _verify_password(cls, plain_password: str, hashed_password: str) -> bool:
@@ -0,0 +1,68 @@
+from typing import List, Optional
+
+from app.config.config import Settings
+from app.daos.endpoints_dao import EndpointDAO
+from app.models import db_models as model
+from app.services.notify_srv import notify_listener
+from app.utils.enums import NotifyChannels
+from app.utils.logger import Logger
+from app.utils.ttl_cache import TTLCache
+
+LOGGER = Logger().start_logger()
+config = Settings().cache
+
+ALL_ENDPOINTS = "endpoints"
+
+
+class EndpointCache:
+    """
+    Read-through cache of endpoint configs and their latest status.
+
+    Entries expire after a few seconds, which bounds how stale a status can be. Changes to an endpoint invalidate it
+    right away: locally through invalidate, and in every other worker through the NOTIFY that EndpointDAO sends in
+    the same transaction as the change. Misses are read through the DAO of the request, when one is given, and always
+    from the primary: a lagging replica could hand back the row from before the change and have it cached again.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(int(config["endpoint_size"]), float(config["endpoint_ttl"]))
+        if self.cache.enabled:
+            # Changes made while nobody was listening were missed
+            notify_listener.subscribe(NotifyChannels.ENDPOINT_CHANGES, self._on_notify, on_reconnect=self.cache.clear)
+
+    def invalidate(self, endpoint_id: int):
+        self.cache.invalidate(ALL_ENDPOINTS, ("endpoint", endpoint_id), ("endpoint_status", endpoint_id))
+
+    async def get_all_with_latest_log_status(self, endpoint_dao: Optional[EndpointDAO] = None) -> List[model.Endpoints]:
+        endpoints = self.cache.get(ALL_ENDPOINTS)
+        if endpoints is None:
+            endpoints = await (endpoint_dao or EndpointDAO()).get_all_with_latest_log_status()
+            self.cache.set(ALL_ENDPOINTS, endpoints)
+        return endpoints
+
+    async def get_by_id(self, endpoint_id: int,
+                        endpoint_dao: Optional[EndpointDAO] = None) -> Optional[model.Endpoints]:
+        endpoint = self.cache.get(("endpoint", endpoint_id))
+        if endpoint is None:
+            endpoint = await (endpoint_dao or EndpointDAO()).get_by_id(endpoint_id)
+            if endpoint:
+                self.cache.set(("endpoint", endpoint_id), endpoint)
+        return endpoint
+
+    async def get_by_id_with_latest_log_status(self, endpoint_id: int,
+                                               endpoint_dao: Optional[EndpointDAO] = None) -> Optional[model.Endpoints]:
+        endpoint = self.cache.get(("endpoint_status", endpoint_id))
+        if endpoint is None:
+            endpoint = await (endpoint_dao or EndpointDAO()).get_by_id_with_latest_log_status(endpoint_id)
+            if endpoint:
+                self.cache.set(("endpoint_status", endpoint_id), endpoint)
+        return endpoint
+
+    def _on_notify(self, payload: str):
+        try:
+            self.invalidate(int(payload))
+        except ValueError:
+            self.cache.clear()
+
+
+endpoint_cache = EndpointCache()
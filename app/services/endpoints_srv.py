@@ -1,21 +1,66 @@
+import base64
+import csv
+import io
+import json
 import uuid
+from collections import defaultdict
 from datetime import timedelta, datetime
+from itertools import groupby
+from operator import attrgetter
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
 
 from fastapi import Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.config import Settings
 from app.daos.endpoints_dao import EndpointDAO, DuplicateEndpointError
 from app.daos.log_table_dao import LogTableDAO
+from app.daos.rollups_dao import RollupDAO
+from app.models import db_models as model
 from app.models.db_models import create_log_table
-from app.schemas.endpoints_sch import BaseEndpointsOut, CreateEndpoint, CreateEndpointInDb, UpdateEndpoint, EndpointsOut
+from app.schemas.endpoints_sch import BaseEndpointsOut, CreateEndpoint, CreateEndpointInDb, UpdateEndpoint
+from app.services.endpoint_cache_srv import endpoint_cache
+from app.services.probe_srv import probe_engine
+from app.utils.buckets import bucket_start, bucket_starts, parse_duration
+from app.utils.database import log_shards
+from app.utils.enums import ExportFormat, LogStorage, RollupGranularity, UptimeBucket
+from app.utils.http_cache import not_modified_since, validators
 from app.utils.logger import Logger
-from app.utils.response import ok, error
+from app.utils.response import ok, error, not_modified
 
 LOGGER = Logger().start_logger()
+log_config = Settings().log
+
+DEFAULT_STATUS_LIMIT = 500
+MAX_STATUS_LIMIT = 5000
+MAX_UPTIME_BUCKETS = 5000
+MAX_BATCH_ENDPOINTS = 1000
+
+EXPORT_COLUMNS = ["id", "status", "created_at", "response", "response_time"]
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+UPTIME_BUCKET_SIZES = {
+    UptimeBucket.FIVE_MINUTES: timedelta(minutes=5),
+    UptimeBucket.HOUR: timedelta(hours=1),
+    UptimeBucket.DAY: timedelta(days=1),
+}
+
+UPTIME_ROLLUPS = {
+    UptimeBucket.HOUR: RollupGranularity.HOUR,
+    UptimeBucket.DAY: RollupGranularity.DAY,
+}
 
 
 class EndpointService:
-    def __init__(self):
-        self.endpoint_dao = EndpointDAO()
-        self.log_table_dao = LogTableDAO()
+    def __init__(self, db: Optional[AsyncSession] = None, read_db: Optional[AsyncSession] = None):
+        self.endpoint_dao = EndpointDAO(db, read_db)
+        self.log_table_dao = LogTableDAO(db, read_db)
+        self.rollup_dao = RollupDAO(db, read_db)
 
     @classmethod
     def generate_table_name(cls):
@@ -27,84 +72,308 @@ class EndpointService:
 
         return table_name
 
+    @classmethod
+    def _endpoint_out(cls, endpoint: model.Endpoints) -> BaseEndpointsOut:
+        """Validate the response model straight from the ORM attributes, without an as_dict copy in between."""
+        return BaseEndpointsOut.model_validate(endpoint, from_attributes=True)
+
+    @classmethod
+    def _endpoint_validators(cls, endpoint: model.Endpoints, *parts) -> dict:
+        """Validators of a response about one endpoint: they change with its config and with every new result."""
+        return validators(endpoint.last_checked_at, cls._endpoint_out(endpoint), *parts)
+
+    async def _latest_runs(self, endpoints: List[model.Endpoints]) -> dict:
+        """Newest readable run of each endpoint by ID, empty unless the logs are kept as runs."""
+        if log_config["storage"] != LogStorage.RUNS.value:
+            return {}
+
+        endpoint_ids_by_shard = defaultdict(list)
+        for endpoint in endpoints:
+            if endpoint.log_table:
+                endpoint_ids_by_shard[endpoint.shard].append(endpoint.id)
+
+        latest_runs = {}
+        for shard, endpoint_ids in endpoint_ids_by_shard.items():
+            for run in await self.log_table_dao.for_shard(shard).select_latest_runs(endpoint_ids):
+                latest_runs[run.endpoint_id] = run
+        return latest_runs
+
+    async def _history_validators(self, endpoints: List[model.Endpoints], *parts) -> dict:
+        """
+        Validators of a response read from the logs of the given endpoints. Runs are written up to
+        runs_flush_interval after last_checked_at moved on, so with runs they follow the newest readable run instead,
+        a client never keeps a copy that misses the results written since.
+        """
+        endpoints_out = [self._endpoint_out(endpoint) for endpoint in endpoints]
+        latest_runs = await self._latest_runs(endpoints)
+        if latest_runs:
+            return validators(max(run.last_seen for run in latest_runs.values()), endpoints_out,
+                              sorted(tuple(run) for run in latest_runs.values()), *parts)
+
+        if log_config["storage"] == LogStorage.RUNS.value:
+            return validators(None, endpoints_out, *parts)
+        return validators(max((endpoint.last_checked_at for endpoint in endpoints if endpoint.last_checked_at),
+                              default=None), endpoints_out, *parts)
+
     async def get_all(self, request: Request):
-        endpoints = await self.endpoint_dao.get_all_with_latest_log_status()
+        endpoints = await endpoint_cache.get_all_with_latest_log_status(self.endpoint_dao)
         if not endpoints:
             LOGGER.info("No endpoints found in the database.")
 
+        endpoints_out = [self._endpoint_out(endpoint) for endpoint in endpoints]
+        headers = validators(max((endpoint.last_checked_at for endpoint in endpoints
+                                  if endpoint.last_checked_at), default=None), endpoints_out)
+        if not_modified_since(request, headers):
+            return not_modified(headers)
+
         LOGGER.info(f"Retrieved {len(endpoints)} endpoints.")
-        return ok(message="Successfully provided all endpoints.",
-                  data=[BaseEndpointsOut.model_validate(endpoint.as_dict()) for endpoint in endpoints])
+        return ok(message="Successfully provided all endpoints.", data=endpoints_out, headers=headers)
 
     async def get_by_id(self, request: Request, endpoint_id: int):
-        endpoint = await self.endpoint_dao.get_by_id_with_latest_log_status(endpoint_id)
+        endpoint = await endpoint_cache.get_by_id_with_latest_log_status(endpoint_id, self.endpoint_dao)
         if not endpoint:
             LOGGER.warning(f"Endpoint with ID {endpoint_id} not found.")
             return error(message=f"Endpoint with ID {endpoint_id} does not exist.",
                          status_code=status.HTTP_404_NOT_FOUND)
 
+        endpoint_out = self._endpoint_out(endpoint)
+        headers = validators(endpoint.last_checked_at, endpoint_out)
+        if not_modified_since(request, headers):
+            return not_modified(headers)
+
         LOGGER.info(f"Successfully retrieved endpoint with ID {endpoint_id}.")
-        return ok(message="Successfully provided endpoint.",
-                  data=BaseEndpointsOut.model_validate(endpoint.as_dict()))
+        return ok(message="Successfully provided endpoint.", data=endpoint_out, headers=headers)
+
+    @classmethod
+    def _encode_cursor(cls, created_at: datetime, record_id: int) -> str:
+        return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{record_id}".encode('utf-8')).decode('utf-8')
 
-    async def get_status_graph_by_id(self, request, endpoint_id):
-        endpoint = await self.endpoint_dao.get_by_id(endpoint_id)
+    @classmethod
+    def _decode_cursor(cls, cursor: str) -> Tuple[datetime, int]:
+        try:
+            created_at, record_id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split('|')
+            return datetime.fromisoformat(created_at), int(record_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Invalid cursor {cursor}.")
+
+    async def get_status_graph_by_id(self, request, endpoint_id, since: Optional[datetime] = None,
+                                     until: Optional[datetime] = None, limit: int = DEFAULT_STATUS_LIMIT,
+                                     cursor: Optional[str] = None, include_response: bool = False):
+        try:
+            before = self._decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return error(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+
+        endpoint = await endpoint_cache.get_by_id_with_latest_log_status(endpoint_id, self.endpoint_dao)
         if not endpoint:
             LOGGER.warning(f"Endpoint with ID {endpoint_id} not found.")
             return error(message=f"Endpoint with ID {endpoint_id} does not exist.",
                          status_code=status.HTTP_404_NOT_FOUND)
 
-        endpoint_data = EndpointsOut.model_validate(endpoint.as_dict())
+        # A page only changes when a new result can be read, so the page itself is not even queried for a 304
+        headers = await self._history_validators([endpoint])
+        if not_modified_since(request, headers):
+            return not_modified(headers)
 
+        logs, next_cursor = [], None
         if endpoint.log_table:
-            log_records = await self.log_table_dao.select_all_from_log_table(endpoint.log_table)
-            endpoint_data.logs = [record._asdict() for record in log_records]
+            log_table_dao = self.log_table_dao.for_shard(endpoint.shard)
+            # One extra record tells whether another page follows
+            log_records = await log_table_dao.select_page(endpoint.log_table, endpoint.id, since, until, before,
+                                                          limit + 1, include_response)
+            logs = [record._asdict() for record in log_records[:limit]]
+            if len(log_records) > limit:
+                next_cursor = self._encode_cursor(logs[-1]["created_at"], logs[-1]["id"])
 
         return ok(message="Successfully provided status graph for endpoint.",
-                  data=endpoint_data.logs)
+                  data={"logs": logs, "next_cursor": next_cursor}, headers=headers)
+
+    @classmethod
+    def _export_value(cls, value):
+        return value.isoformat() if isinstance(value, datetime) else value
 
-    async def get_uptime_graph_by_id(self, request: Request, endpoint_id: int):
-        endpoint = await self.endpoint_dao.get_by_id(endpoint_id)
+    @classmethod
+    async def _encode_export(cls, chunks: AsyncIterator[list], export_format: ExportFormat) -> AsyncIterator[str]:
+        if export_format == ExportFormat.CSV:
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+        async for records in chunks:
+            buffer = io.StringIO()
+            if export_format == ExportFormat.CSV:
+                writer = csv.writer(buffer)
+                for record in records:
+                    writer.writerow([json.dumps(record.response) if column == "response"
+                                     else cls._export_value(getattr(record, column)) for column in EXPORT_COLUMNS])
+            else:
+                for record in records:
+                    buffer.write(json.dumps({column: cls._export_value(getattr(record, column))
+                                             for column in EXPORT_COLUMNS}) + "\n")
+            yield buffer.getvalue()
+
+    async def export_logs_by_id(self, request: Request, endpoint_id: int, export_format: ExportFormat,
+                                since: Optional[datetime] = None, until: Optional[datetime] = None):
+        endpoint = await endpoint_cache.get_by_id_with_latest_log_status(endpoint_id, self.endpoint_dao)
         if not endpoint:
             LOGGER.warning(f"Endpoint with ID {endpoint_id} not found.")
             return error(message=f"Endpoint with ID {endpoint_id} does not exist.",
                          status_code=status.HTTP_404_NOT_FOUND)
 
-        hourly_logs = []
-        hours = 72
+        if not endpoint.log_table:
+            return error(message=f"Endpoint with ID {endpoint_id} has no logs.",
+                         status_code=status.HTTP_404_NOT_FOUND)
 
-        if endpoint.log_table:
-            logs = await self.log_table_dao.select_logs_from_last_hours(endpoint.log_table, hours)
+        headers = await self._history_validators([endpoint])
+        if not_modified_since(request, headers):
+            return not_modified(headers)
+
+        LOGGER.info(f"Exporting logs of endpoint ID {endpoint_id} as {export_format.value}.")
+        log_table_dao = self.log_table_dao.for_shard(endpoint.shard)
+        chunks = log_table_dao.stream_records(endpoint.log_table, endpoint.id, since, until)
+        return StreamingResponse(
+            self._encode_export(chunks, export_format),
+            media_type=EXPORT_MEDIA_TYPES[export_format],
+            headers={**headers,
+                     "Content-Disposition": f'attachment; filename="endpoint-{endpoint_id}.{export_format.value}"'}
+        )
+
+    async def _get_uptime_buckets(self, endpoint: model.Endpoints, bucket: UptimeBucket, start_time: datetime):
+        """Aggregated buckets from start_time on: rollups for hours and days, grouped raw results below that."""
+        if bucket in UPTIME_ROLLUPS:
+            return await self.rollup_dao.get_by_endpoint_id(endpoint.id, UPTIME_ROLLUPS[bucket], start_time)
+
+        if not endpoint.log_table:
+            return []
+
+        bucket_minutes = int(UPTIME_BUCKET_SIZES[bucket].total_seconds() // 60)
+        log_table_dao = self.log_table_dao.for_shard(endpoint.shard)
+        return await log_table_dao.select_buckets(endpoint.log_table, endpoint.id, start_time, bucket_minutes)
+
+    async def _get_uptime_buckets_many(self, endpoints: List[model.Endpoints], bucket: UptimeBucket,
+                                       start_time: datetime):
+        """Same as _get_uptime_buckets for many endpoints in one query, ordered by endpoint and bucket."""
+        if bucket in UPTIME_ROLLUPS:
+            return await self.rollup_dao.get_by_endpoint_ids([endpoint.id for endpoint in endpoints],
+                                                             UPTIME_ROLLUPS[bucket], start_time)
+
+        bucket_minutes = int(UPTIME_BUCKET_SIZES[bucket].total_seconds() // 60)
+        log_tables_by_shard = defaultdict(dict)
+        for endpoint in endpoints:
+            if endpoint.log_table:
+                log_tables_by_shard[endpoint.shard][endpoint.id] = endpoint.log_table
+
+        # One query per shard, merged back into a single order since an endpoint lives on one shard only
+        buckets = []
+        for shard, log_tables in log_tables_by_shard.items():
+            buckets += await self.log_table_dao.for_shard(shard).select_buckets_many(log_tables, start_time,
+                                                                                      bucket_minutes)
+        if len(log_tables_by_shard) > 1:
+            buckets.sort(key=lambda row: (row.endpoint_id, row.bucket))
+        return buckets
 
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=hours)
+    @classmethod
+    def _uptime_window(cls, window: str, bucket: Optional[UptimeBucket]) -> Tuple[UptimeBucket, timedelta, int]:
+        """Bucket, bucket size and number of buckets of an uptime window. Raises ValueError for invalid windows."""
+        window_length = parse_duration(window)
 
-            for hour in range(hours):
-                current_hour_start = start_time + timedelta(hours=hour)
-                next_hour_start = current_hour_start + timedelta(hours=1)
+        if not bucket:
+            bucket = UptimeBucket.HOUR if window_length <= timedelta(hours=72) else UptimeBucket.DAY
+        bucket_size = UPTIME_BUCKET_SIZES[bucket]
 
-                # Ensure the next_hour_start does not exceed the end_time
-                if next_hour_start > end_time:
-                    next_hour_start = end_time
+        bucket_count = -(-window_length // bucket_size)
+        if bucket_count > MAX_UPTIME_BUCKETS:
+            raise ValueError(f"Window {window} has {bucket_count} buckets of {bucket.value}, "
+                             f"at most {MAX_UPTIME_BUCKETS} are allowed. Use a larger bucket.")
+        return bucket, bucket_size, bucket_count
 
-                logs_current_hour = [log._asdict() for log in logs
-                                     if current_hour_start <= log._asdict()['created_at'] < next_hour_start]
+    @classmethod
+    def _fill_buckets(cls, rows: Iterable, start_time: datetime, end_time: datetime,
+                      bucket_size: timedelta) -> List[dict]:
+        """Rows come sorted by bucket, so a single pass over both sequences fills the gaps with nodata."""
+        rows = iter(rows)
+        row = next(rows, None)
+
+        buckets = []
+        for current_bucket in bucket_starts(start_time, end_time, bucket_size):
+            while row is not None and row.bucket < current_bucket:
+                row = next(rows, None)
+
+            if row is not None and row.bucket == current_bucket:
+                buckets.append(model.RollupMixin.bucket_as_dict(row))
+                row = next(rows, None)
+            else:
+                buckets.append({"bucket": current_bucket.isoformat(), "status": "nodata",
+                                "details": "No logs for this period"})
+        return buckets
+
+    async def get_uptime_graph_by_id(self, request: Request, endpoint_id: int, window: str = "72h",
+                                     bucket: Optional[UptimeBucket] = None):
+        try:
+            bucket, bucket_size, bucket_count = self._uptime_window(window, bucket)
+        except ValueError as e:
+            return error(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
 
-                error_log = next((log for log in logs_current_hour if log['status'] != 'ok'), None)
+        endpoint = await endpoint_cache.get_by_id_with_latest_log_status(endpoint_id, self.endpoint_dao)
+        if not endpoint:
+            LOGGER.warning(f"Endpoint with ID {endpoint_id} not found.")
+            return error(message=f"Endpoint with ID {endpoint_id} does not exist.",
+                         status_code=status.HTTP_404_NOT_FOUND)
 
-                if error_log:
-                    hourly_log = error_log
-                elif logs_current_hour:
-                    hourly_log = max(logs_current_hour, key=lambda log: log['created_at'])
-                else:
-                    hourly_log = {"hour": current_hour_start.strftime("%Y-%m-%d %H:%M:%S"), "status": "nodata",
-                                  "details": "No logs for this hour"}
+        # The last bucket is the current, still filling one
+        end_time = datetime.now()
+        start_time = bucket_start(end_time, bucket_size) - (bucket_count - 1) * bucket_size
 
-                hourly_logs.append(hourly_log)
+        # The window also moves on by itself when a new bucket starts; rollups are written right away, raw logs not
+        headers = self._endpoint_validators(endpoint, start_time) if bucket in UPTIME_ROLLUPS \
+            else await self._history_validators([endpoint], start_time)
+        if not_modified_since(request, headers):
+            return not_modified(headers)
 
-            print(len(hourly_logs))
+        rows = await self._get_uptime_buckets(endpoint, bucket, start_time)
         return ok(message="Successfully provided status graph for endpoint.",
-                  data=hourly_logs)
+                  data=self._fill_buckets(rows, start_time, end_time, bucket_size), headers=headers)
+
+    async def get_uptime_graphs(self, request: Request, endpoint_ids: Optional[List[int]] = None,
+                                application_id: Optional[int] = None, window: str = "72h",
+                                bucket: Optional[UptimeBucket] = None):
+        """Uptime graphs of many endpoints: one query for the endpoints and one for all of their buckets."""
+        if not endpoint_ids and application_id is None:
+            return error(message="Select the endpoints with endpoint_id or application_id.",
+                         status_code=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            bucket, bucket_size, bucket_count = self._uptime_window(window, bucket)
+        except ValueError as e:
+            return error(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+
+        endpoints = await self.endpoint_dao.get_many_with_latest_log_status(endpoint_ids, application_id)
+        if len(endpoints) > MAX_BATCH_ENDPOINTS:
+            return error(message=f"{len(endpoints)} endpoints selected, at most {MAX_BATCH_ENDPOINTS} are allowed.",
+                         status_code=status.HTTP_400_BAD_REQUEST)
+
+        end_time = datetime.now()
+        start_time = bucket_start(end_time, bucket_size) - (bucket_count - 1) * bucket_size
+
+        # Rollups are written right away, raw logs kept as runs only once they are flushed
+        if bucket in UPTIME_ROLLUPS:
+            last_checked_at = max((endpoint.last_checked_at for endpoint in endpoints if endpoint.last_checked_at),
+                                  default=None)
+            headers = validators(last_checked_at, [self._endpoint_out(endpoint) for endpoint in endpoints], start_time)
+        else:
+            headers = await self._history_validators(endpoints, start_time)
+        if not_modified_since(request, headers):
+            return not_modified(headers)
+
+        rows = await self._get_uptime_buckets_many(endpoints, bucket, start_time) if endpoints else []
+        rows_by_endpoint = {endpoint_id: list(endpoint_rows)
+                            for endpoint_id, endpoint_rows in groupby(rows, key=attrgetter("endpoint_id"))}
+
+        LOGGER.info(f"Provided uptime graphs of {len(endpoints)} endpoints.")
+        return ok(message="Successfully provided uptime graphs for endpoints.",
+                  data=[{"endpoint_id": endpoint.id, "name": endpoint.name, "status": endpoint.status,
+                         "buckets": self._fill_buckets(rows_by_endpoint.get(endpoint.id, []), start_time, end_time,
+                                                       bucket_size)}
+                        for endpoint in endpoints],
+                  headers=headers)
 
     async def create_endpoint(self, request: Request, endpoint_data: CreateEndpoint):
         try:
@@ -120,36 +389,46 @@ class EndpointService:
                 status_code=endpoint_data.status_code,
                 response=endpoint_data.response,
                 type=endpoint_data.type,
-                log_table=log_table)
+                jitter=endpoint_data.jitter,
+                retention_days=endpoint_data.retention_days,
+                log_table=log_table,
+                shard=log_shards.assign(log_table))
 
             endpoint = await self.endpoint_dao.create(db_data)
-            await create_log_table(log_table)
+            endpoint_cache.invalidate(endpoint.id)
+            if log_config["storage"] == LogStorage.TABLE.value:
+                await create_log_table(log_table, endpoint.shard)
+            probe_engine.upsert(endpoint)
 
             return ok(
                 message="Successfully created endpoint.",
-                data=BaseEndpointsOut.model_validate(endpoint.as_dict())
+                data=self._endpoint_out(endpoint)
             )
         except DuplicateEndpointError as e:
             LOGGER.error(f"DuplicateEndpointError in create_endpoint: {e}")
             return error(message=e.detail, status_code=status.HTTP_400_BAD_REQUEST)
 
     async def update_endpoint(self, request: Request, endpoint_id: int, endpoint_data: UpdateEndpoint):
-        endpoint = await self.endpoint_dao.get_by_id(endpoint_id)
+        endpoint = await endpoint_cache.get_by_id(endpoint_id, self.endpoint_dao)
         if not endpoint:
             LOGGER.warning(f"Endpoint with ID {endpoint_id} not found.")
             return error(message=f"Endpoint with ID {endpoint_id} does not exist.",
                          status_code=status.HTTP_404_NOT_FOUND)
 
+        # Omitted fields are kept, overrides explicitly sent as null are reset to the global default
+        cleared = UpdateEndpoint.CLEARABLE_FIELDS & endpoint_data.model_fields_set
         data_to_update = endpoint_data.model_dump()
-        data_to_update = {k: v for k, v in data_to_update.items() if v is not None}
+        data_to_update = {k: v for k, v in data_to_update.items() if v is not None or k in cleared}
 
         endpoint = await self.endpoint_dao.update(endpoint_id, data_to_update)
+        endpoint_cache.invalidate(endpoint_id)
+        probe_engine.upsert(endpoint)
 
         LOGGER.info(f"Successfully updated endpoint ID {endpoint_id}.")
-        return ok(message="Successfully updated endpoint.", data=BaseEndpointsOut.model_validate(endpoint.as_dict()))
+        return ok(message="Successfully updated endpoint.", data=self._endpoint_out(endpoint))
 
     async def delete_endpoint(self, request: Request, endpoint_id: int):
-        endpoint = await self.endpoint_dao.get_by_id(endpoint_id)
+        endpoint = await endpoint_cache.get_by_id(endpoint_id, self.endpoint_dao)
         if not endpoint:
             LOGGER.warning(f"Attempted to delete a non-existent endpoint with ID {endpoint_id}.")
             return error(
@@ -157,7 +436,9 @@ class EndpointService:
                 status_code=status.HTTP_404_NOT_FOUND
             )
 
+        probe_engine.remove(endpoint_id)
         await self.endpoint_dao.delete(endpoint_id)
-        await self.log_table_dao.delete_log_table(endpoint.log_table)
+        endpoint_cache.invalidate(endpoint_id)
+        await self.log_table_dao.for_shard(endpoint.shard).delete_log_table(endpoint.log_table, endpoint.id)
         LOGGER.info(f"Endpoint with ID {endpoint_id} has been successfully deleted.")
         return ok(message="Endpoint has been successfully deleted.")
@@ -0,0 +1,85 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import asyncpg
+
+from app.utils.database import SQLALCHEMY_DATABASE_URL
+from app.utils.enums import AdvisoryLocks
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+
+
+class LeaderElection:
+    """
+    Elects the one worker that runs the background services, among every process sharing the database.
+
+    Each worker keeps a connection of its own and tries a session-level advisory lock on it every retry_interval
+    seconds. Postgres releases the lock when the leader's connection goes away, so another worker takes over when the
+    leader dies. The leader pings its connection at the same interval and stops its services as soon as it is lost.
+    """
+
+    def __init__(self, retry_interval: float = 5.0):
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._services: List[Tuple[Callable[[], Awaitable], Callable[[], Awaitable]]] = []
+        self._runner: Optional[asyncio.Task] = None
+
+    def register(self, start: Callable[[], Awaitable], stop: Callable[[], Awaitable]):
+        """Run start in the elected worker, and stop when it loses the lock or shuts down, in reverse order."""
+        self._services.append((start, stop))
+
+    async def start(self):
+        if self._runner:
+            return
+
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._runner:
+            return
+
+        self._runner.cancel()
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+
+    async def _start_services(self):
+        self.is_leader = True
+        LOGGER.info("This worker was elected to run the background services.")
+        for start, _ in self._services:
+            await start()
+
+    async def _stop_services(self):
+        for _, stop in reversed(self._services):
+            try:
+                await stop()
+            except Exception as e:
+                LOGGER.error(f"Failed to stop a background service: {e}")
+        self.is_leader = False
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(SQLALCHEMY_DATABASE_URL)
+                while not await connection.fetchval("SELECT pg_try_advisory_lock($1)", AdvisoryLocks.LEADER.value):
+                    await asyncio.sleep(self.retry_interval)
+
+                await self._start_services()
+                while True:
+                    await asyncio.sleep(self.retry_interval)
+                    await connection.fetchval("SELECT 1", timeout=self.retry_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"Leader election connection failed: {e}")
+            finally:
+                if self.is_leader:
+                    await self._stop_services()
+                if connection and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(self.retry_interval)
+
+
+leader_election = LeaderElection()
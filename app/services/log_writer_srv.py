@@ -0,0 +1,229 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, ProgrammingError
+
+from app.config.config import Settings
+from app.daos.log_table_dao import LogTableDAO, LogRecord
+from app.utils.enums import LogStorage
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+config = Settings().probe
+log_config = Settings().log
+
+# SQLSTATE classes of errors caused by the rows themselves: data exceptions, constraint violations and statements
+# the data made invalid. asyncpg's data errors reach SQLAlchemy as a plain DBAPIError, hence the SQLSTATE check.
+REJECTED_SQLSTATE_CLASSES = ("22", "23", "42")
+
+
+def is_rejected(error: Exception) -> bool:
+    """Whether the database refused the rows of a batch, which writing them again cannot fix."""
+    if isinstance(error, (DataError, IntegrityError, ProgrammingError)):
+        return True
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None)
+    return isinstance(error, DBAPIError) and bool(sqlstate) and sqlstate[:2] in REJECTED_SQLSTATE_CLASSES
+
+
+class LogWriter:
+    """
+    Write-behind buffer for probe results.
+
+    Results are collected in memory and flushed when batch_size rows are waiting or flush_interval seconds have
+    passed. Writers wait while buffer_size rows are pending, so a slow database slows the probes down instead of
+    growing the buffer without bound.
+
+    A batch that fails on the connection is kept and written again, up to flush_retries times. A batch the database
+    rejects is split until the offending rows are found, which are dropped so they cannot hold up the rest.
+
+    With the runs log storage, written results are held for another runs_flush_interval seconds before their runs
+    are written, so the open run of an endpoint is extended once per interval instead of on every flush. Statuses,
+    rollups and events do not wait; the runs held when the process dies are lost.
+    """
+
+    def __init__(self):
+        self.buffer_size = int(config["buffer_size"])
+        self.batch_size = int(config["batch_size"])
+        self.flush_interval = float(config["flush_interval"])
+        self.flush_retries = int(config["flush_retries"])
+        self.hold_runs = log_config["storage"] == LogStorage.RUNS.value
+        self.runs_flush_interval = float(log_config["runs_flush_interval"])
+
+        self._buffer: List[LogRecord] = []
+        self._flush_requested = asyncio.Event()
+        self._space_available = asyncio.Event()
+        self._space_available.set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self._retries = 0
+        # Size of the failed batch at the head of the buffer, retried as it was so log shards recognize it
+        self._retry_size = 0
+        self._runs: List[LogRecord] = []
+        self._runs_due_at = 0.0
+        # Runs whose write failed, written again as they were before the ones held since
+        self._failed_runs: List[LogRecord] = []
+
+    def __len__(self):
+        return len(self._buffer)
+
+    async def start(self):
+        if self._flusher:
+            return
+
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._run())
+        LOGGER.info(f"Log writer started with batch size {self.batch_size} and buffer size {self.buffer_size}.")
+
+    async def stop(self):
+        """Stop the periodic flush and write out everything still buffered."""
+        if self._flusher:
+            # Let a flush that is already running finish instead of cancelling it halfway through a batch
+            self._stopping = True
+            self._flush_requested.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+
+        if self._buffer:
+            LOGGER.info(f"Flushing {len(self._buffer)} buffered probe results before shutdown.")
+            try:
+                await self.flush()
+            except Exception:
+                LOGGER.error(f"Dropped {len(self._buffer)} probe results that could not be written on shutdown.")
+
+        while self._failed_runs or self._runs:
+            held = len(self._failed_runs) + len(self._runs)
+            if not await self.flush_runs(force=True):
+                LOGGER.error(f"Dropped the runs of {held} probe results that could not be written on shutdown.")
+                break
+
+    async def write(self, record: LogRecord):
+        # Backpressure: wait for the flusher to make room once the buffer is full
+        while len(self._buffer) >= self.buffer_size:
+            self._space_available.clear()
+            self._flush_requested.set()
+            await self._space_available.wait()
+
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._flush_requested.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._buffer:
+                size = self._retry_size or self.batch_size
+                batch = self._buffer[:size]
+                del self._buffer[:size]
+                self._retry_size = 0
+
+                # Rows written or dropped so far, always the head of the batch since halves are written in order
+                progress = {"done": 0, "dropped": 0}
+                try:
+                    await self._write(batch, progress)
+                    self._retries = 0
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self._retries += 1
+                    batch = batch[progress["done"]:]
+                    if self._retries > self.flush_retries:
+                        progress["done"] += len(batch)
+                        progress["dropped"] += len(batch)
+                        self._retries = 0
+                        LOGGER.error(f"Dropped {len(batch)} probe results after {self.flush_retries} failed "
+                                     f"flushes: {e}")
+                        continue
+
+                    # Keep the rest for the next flush; writers block on the full buffer until the database is back
+                    self._buffer[:0] = batch
+                    self._retry_size = len(batch)
+                    LOGGER.error(f"Failed to flush {len(batch)} probe results: {e}")
+                    raise e
+                finally:
+                    self.flushed += progress["done"] - progress["dropped"]
+                    self.dropped += progress["dropped"]
+                    if len(self._buffer) < self.buffer_size:
+                        self._space_available.set()
+
+    def _hold_runs(self, records: List[LogRecord]):
+        if not self._runs:
+            self._runs_due_at = time.monotonic() + self.runs_flush_interval
+        self._runs.extend(records)
+
+        # Bounded like the buffer, should the runs keep failing to be written
+        excess = len(self._failed_runs) + len(self._runs) - self.buffer_size
+        if excess > 0:
+            del self._runs[:excess]
+            self.dropped += excess
+            LOGGER.error(f"Dropped the runs of {excess} probe results, too many are waiting to be written.")
+
+    async def flush_runs(self, force: bool = False) -> bool:
+        """Write the held runs once they are due, or right away with force. Returns whether all were written."""
+        if self._failed_runs:
+            runs, self._failed_runs = self._failed_runs, []
+        elif self._runs and (force or time.monotonic() >= self._runs_due_at):
+            runs, self._runs = self._runs, []
+        else:
+            return True
+
+        progress = {"done": 0, "dropped": 0}
+        try:
+            await self._write(runs, progress, runs=True)
+            return True
+        except Exception as e:
+            self.failed_flushes += 1
+            self._failed_runs = runs[progress["done"]:]
+            LOGGER.error(f"Failed to write the runs of {len(self._failed_runs)} probe results: {e}")
+            return False
+        finally:
+            self.dropped += progress["dropped"]
+
+    async def _write(self, batch: List[LogRecord], progress: dict, runs: bool = False):
+        """Write a batch, halving it while the database rejects it and dropping the single rows it still rejects."""
+        try:
+            if runs:
+                await LogTableDAO().insert_runs(batch)
+            else:
+                await LogTableDAO().insert_logs(batch)
+                if self.hold_runs:
+                    self._hold_runs(batch)
+            progress["done"] += len(batch)
+            return
+        except Exception as e:
+            if not is_rejected(e):
+                raise e
+            if len(batch) == 1:
+                LOGGER.error(f"Dropped a probe result of endpoint ID {batch[0].endpoint_id} rejected by the "
+                             f"database: {e}")
+                progress["done"] += 1
+                progress["dropped"] += 1
+                return
+
+        middle = len(batch) // 2
+        await self._write(batch[:middle], progress, runs)
+        await self._write(batch[middle:], progress, runs)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+
+            if self._stopping:
+                return
+
+            try:
+                await self.flush()
+                if self.hold_runs:
+                    await self.flush_runs()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+
+
+log_writer = LogWriter()
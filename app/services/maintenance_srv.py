@@ -0,0 +1,150 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from app.config.config import Settings
+from app.daos.endpoints_dao import EndpointDAO
+from app.daos.log_table_dao import LogTableDAO
+from app.daos.rollups_dao import RollupDAO
+from app.daos.sessions_dao import SessionDAO
+from app.models.db_models import create_log_partitions, create_partitioned_log_table, drop_log_partitions_before
+from app.utils.database import log_shards
+from app.utils.enums import LogStorage, RollupGranularity, SessionStores
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+log_config = Settings().log
+app_config = Settings().app
+
+
+class MaintenanceService:
+    """Periodic housekeeping of the log storage and the server-side sessions."""
+
+    def __init__(self, interval: int = 3600):
+        self.interval = interval
+        self._runner: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._runner:
+            return
+
+        # Partitions are created up front so the storage is ready before the probe engine writes to it
+        if log_config["storage"] == LogStorage.PARTITIONED.value:
+            for shard in log_shards.targets():
+                await create_partitioned_log_table(shard)
+            await self.ensure_partitions()
+
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._runner:
+            return
+
+        self._runner.cancel()
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+
+    async def run_once(self):
+        if log_config["storage"] == LogStorage.PARTITIONED.value:
+            await self.ensure_partitions()
+        await self.apply_retention()
+        if app_config["session_store"] == SessionStores.DATABASE.value:
+            await self.expire_sessions()
+        if log_shards.enabled:
+            await self.expire_shard_batches()
+
+    async def ensure_partitions(self):
+        """Create the daily partitions from today up to log_partitions_ahead days in the future, on every shard."""
+        today = date.today()
+        for shard in log_shards.targets():
+            await create_log_partitions(today, today + timedelta(days=int(log_config["partitions_ahead"])), shard)
+        LOGGER.debug(f"Log partitions ensured up to {int(log_config['partitions_ahead'])} days ahead.")
+
+    async def apply_retention(self):
+        """
+        Expire raw results and rollups past their retention. Whole partitions are dropped where every endpoint
+        allows it, everything else is deleted in small batches.
+        """
+        now = datetime.now()
+        batch_size = int(log_config["retention_batch_size"])
+        global_days = int(log_config["retention_days"])
+
+        # An endpoint's own retention_days overrides the global one, 0 keeps its logs forever
+        endpoints = [endpoint for endpoint in await EndpointDAO().get_all() if endpoint.log_table]
+        retention = {endpoint.id: global_days if endpoint.retention_days is None else endpoint.retention_days
+                     for endpoint in endpoints}
+
+        # Logs older than the longest retention can go everywhere, unless some endpoint keeps them forever
+        longest_days = max([global_days, *retention.values()]) if global_days and all(retention.values()) else 0
+
+        partition_days = 0
+        if log_config["storage"] == LogStorage.PARTITIONED.value and longest_days:
+            partition_days = longest_days
+            cutoff_day = (now - timedelta(days=partition_days)).date()
+            # A shard that fails is retried on the next run, the other shards and endpoints go ahead meanwhile
+            for shard in log_shards.targets():
+                try:
+                    dropped = await drop_log_partitions_before(cutoff_day, shard)
+                    if dropped:
+                        LOGGER.info(f"Retention dropped log partitions {', '.join(dropped)} "
+                                    f"on {self._storage_name(shard)}.")
+                except Exception as e:
+                    LOGGER.error(f"Retention failed to drop log partitions on {self._storage_name(shard)}: {e}")
+
+        for endpoint in endpoints:
+            days = retention[endpoint.id]
+            if not days or days == partition_days:
+                continue
+
+            try:
+                deleted = await LogTableDAO(shard=endpoint.shard).delete_logs_before(
+                    endpoint.log_table, endpoint.id, now - timedelta(days=days), batch_size)
+                if deleted:
+                    LOGGER.info(f"Retention deleted {deleted} logs of endpoint ID {endpoint.id}.")
+            except Exception as e:
+                LOGGER.error(f"Retention failed for endpoint ID {endpoint.id}: {e}")
+
+        # Responses are shared by all endpoints of a shard; last_seen_at lags by up to a day, hence the extra day
+        if longest_days:
+            for shard in log_shards.targets():
+                deleted = await LogTableDAO(shard=shard).delete_responses_before(
+                    now - timedelta(days=longest_days + 1), batch_size)
+                if deleted:
+                    LOGGER.info(f"Retention deleted {deleted} unreferenced responses on {self._storage_name(shard)}.")
+
+        rollup_days = int(log_config["rollup_retention_days"])
+        if rollup_days:
+            for granularity in RollupGranularity:
+                deleted = await RollupDAO().delete_before(granularity, now - timedelta(days=rollup_days), batch_size)
+                if deleted:
+                    LOGGER.info(f"Retention deleted {deleted} {granularity.value} rollups.")
+
+    @classmethod
+    def _storage_name(cls, shard: Optional[int]) -> str:
+        return "the primary" if shard is None else f"log shard {shard}"
+
+    async def expire_sessions(self):
+        deleted = await SessionDAO().delete_expired(int(log_config["retention_batch_size"]))
+        if deleted:
+            LOGGER.info(f"Deleted {deleted} expired sessions.")
+
+    async def expire_shard_batches(self):
+        """Forget the batches applied on the log shards a day ago, the log writer gives up on a batch well before."""
+        for shard in range(len(log_shards.engines)):
+            deleted = await LogTableDAO(shard=shard).delete_shard_batches_before(datetime.now() - timedelta(days=1))
+            if deleted:
+                LOGGER.debug(f"Forgot {deleted} applied batches on {self._storage_name(shard)}.")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"Log storage maintenance failed: {e}")
+
+            await asyncio.sleep(self.interval)
+
+
+maintenance_service = MaintenanceService()
@@ -0,0 +1,86 @@
+import asyncio
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+from app.utils.database import SQLALCHEMY_DATABASE_URL
+from app.utils.enums import NotifyChannels
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+
+
+class NotifyListener:
+    """
+    A single LISTEN connection per process, shared by everything that follows changes made by other workers.
+
+    Subscribers register a callback per channel and, optionally, one that runs whenever the connection is
+    (re)established, since notifications sent while it was down are lost.
+    """
+
+    def __init__(self, reconnect_interval: float = 5.0):
+        self.reconnect_interval = reconnect_interval
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._reconnect_callbacks: List[Callable[[], None]] = []
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: NotifyChannels, callback: Callable[[str], None],
+                  on_reconnect: Optional[Callable[[], None]] = None):
+        """Register a callback for the payloads of a channel; takes effect on the next (re)connect."""
+        self._callbacks[channel.value].append(callback)
+        if on_reconnect:
+            self._reconnect_callbacks.append(on_reconnect)
+
+    async def start(self):
+        if self._listener or not self._callbacks:
+            return
+
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if not self._listener:
+            return
+
+        self._listener.cancel()
+        await asyncio.gather(self._listener, return_exceptions=True)
+        self._listener = None
+
+    def _dispatch(self, connection, pid, channel, payload):
+        for callback in self._callbacks[channel]:
+            try:
+                callback(payload)
+            except Exception as e:
+                LOGGER.error(f"Failed to handle a notification on {channel}: {e}")
+
+    def _reconnected(self):
+        for callback in self._reconnect_callbacks:
+            callback()
+
+    async def _listen(self):
+        """Keep the connection listening on every subscribed channel, reconnecting whenever it is lost."""
+        while True:
+            connection = None
+            terminated = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(SQLALCHEMY_DATABASE_URL)
+                connection.add_termination_listener(lambda _: terminated.set())
+                for channel in self._callbacks:
+                    await connection.add_listener(channel, self._dispatch)
+                self._reconnected()
+                LOGGER.info(f"Listening for notifications on {', '.join(self._callbacks)}.")
+                await terminated.wait()
+                LOGGER.warning("Lost the notification listener connection, reconnecting.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"Could not listen for notifications: {e}")
+            finally:
+                if connection and not connection.is_closed():
+                    await connection.close()
+
+            self._reconnected()
+            await asyncio.sleep(self.reconnect_interval)
+
+
+notify_listener = NotifyListener()
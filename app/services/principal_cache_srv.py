@@ -0,0 +1,41 @@
+from typing import Optional
+
+from app.config.config import Settings
+from app.daos.users_dao import UserDAO
+from app.services.notify_srv import notify_listener
+from app.utils.enums import NotifyChannels
+from app.utils.ttl_cache import TTLCache
+
+config = Settings().cache
+
+
+class PrincipalCache:
+    """
+    Read-through cache of signed-in users by email, so authenticating a request is a dictionary lookup.
+
+    Entries expire after cache_principal_ttl seconds. Changes to a user invalidate it right away: locally through
+    invalidate, and in every other worker through the NOTIFY that UserDAO sends in the same transaction as the change.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(int(config["principal_size"]), float(config["principal_ttl"]))
+        if self.cache.enabled:
+            # Changes made while nobody was listening were missed
+            notify_listener.subscribe(NotifyChannels.USER_CHANGES, self.invalidate, on_reconnect=self.cache.clear)
+
+    def invalidate(self, email: str):
+        self.cache.invalidate(email)
+
+    async def get(self, email: str) -> Optional[dict]:
+        """The user as returned by Users.as_dict, or None when no user has that email."""
+        principal = self.cache.get(email)
+        if principal is None:
+            user = await UserDAO().get_by_email(email)
+            if not user:
+                return None
+            principal = user.as_dict()
+            self.cache.set(email, principal)
+        return principal
+
+
+principal_cache = PrincipalCache()
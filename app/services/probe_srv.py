@@ -0,0 +1,309 @@
+import asyncio
+import math
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+import httpx
+
+from app.config.config import Settings
+from app.daos.endpoints_dao import EndpointDAO
+from app.daos.log_table_dao import LogRecord
+from app.models import db_models as model
+from app.services.log_writer_srv import log_writer
+from app.services.notify_srv import notify_listener
+from app.utils.cron import cron_cache, jitter_offset
+from app.utils.enums import NotifyChannels, ProbeStatus
+from app.utils.logger import Logger
+from app.utils.scheduler import CronScheduler
+
+LOGGER = Logger().start_logger()
+config = Settings().probe
+
+
+class ProbeEngine:
+    """Runs the cron schedules stored on endpoints and writes the results to their log tables."""
+
+    # Characters of a response body kept in the logs
+    MAX_BODY_SIZE = 1024
+
+    def __init__(self):
+        self.concurrency = int(config["concurrency"])
+        self.timeout = float(config["timeout"])
+        self.refresh_interval = timedelta(seconds=int(config["refresh_interval"]))
+        self.jitter = int(config["jitter"])
+
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        self.scheduler = CronScheduler()
+        self._endpoints: Dict[int, model.Endpoints] = {}
+        self._offsets: Dict[int, timedelta] = {}
+        self._wakeup = asyncio.Event()
+        self._in_flight: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._next_refresh = datetime.min
+
+        self.fired = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+
+        # Endpoints changed through another worker are picked up right away, not at the next periodic refresh
+        notify_listener.subscribe(NotifyChannels.ENDPOINT_CHANGES, self._on_endpoint_change)
+
+    def _offset(self, endpoint: model.Endpoints) -> timedelta:
+        """Per-endpoint spread inside the cron interval; the endpoint's own jitter overrides the global one."""
+        jitter = self.jitter if endpoint.jitter is None else endpoint.jitter
+        window = min(timedelta(seconds=jitter), cron_cache.interval(endpoint.cron, datetime.now()))
+        return jitter_offset(endpoint.id, window)
+
+    def _next_run(self, endpoint: model.Endpoints, after: datetime) -> datetime:
+        # Shift the schedule by the offset, so the nominal period between runs is kept
+        offset = self._offsets[endpoint.id]
+        return cron_cache.next_after(endpoint.cron, after - offset) + offset
+
+    @classmethod
+    def _matches_expected(cls, expected: dict, actual) -> bool:
+        """Every key of the expected response must be present in the actual one with the same value."""
+        if not expected:
+            return True
+        if not isinstance(actual, dict):
+            return False
+        return all(key in actual and actual[key] == value for key, value in expected.items())
+
+    @classmethod
+    def _sanitize(cls, value):
+        """Drop what JSONB refuses from a response: NUL characters, and NaN or infinite numbers, which become null."""
+        if isinstance(value, str):
+            return value.replace("\x00", "")
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        if isinstance(value, dict):
+            return {cls._sanitize(key): cls._sanitize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls._sanitize(item) for item in value]
+        return value
+
+    async def start(self):
+        if self._runner:
+            return
+
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        )
+        self._runner = asyncio.create_task(self._run())
+        LOGGER.info(f"Probe engine started with concurrency {self.concurrency}.")
+
+    async def stop(self):
+        if not self._runner:
+            return
+
+        self._runner.cancel()
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+
+        # Let the probes already on the wire finish and write their results
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        await self.client.aclose()
+        self.client = None
+        LOGGER.info("Probe engine stopped.")
+
+    @classmethod
+    def _is_probeable(cls, endpoint: model.Endpoints) -> bool:
+        return bool(endpoint.cron and endpoint.url and endpoint.log_table)
+
+    def upsert(self, endpoint: model.Endpoints):
+        """Add or update a single endpoint; only a changed cron re-arms its schedule."""
+        if not self._runner:
+            return
+
+        if not self._is_probeable(endpoint):
+            self.remove(endpoint.id)
+            return
+
+        known = self._endpoints.get(endpoint.id)
+        self._endpoints[endpoint.id] = endpoint
+        if not known or known.cron != endpoint.cron or known.jitter != endpoint.jitter \
+                or endpoint.id not in self.scheduler:
+            self._offsets[endpoint.id] = self._offset(endpoint)
+            self.scheduler.schedule(endpoint.id, self._next_run(endpoint, datetime.now()))
+            self._wakeup.set()
+
+    def remove(self, endpoint_id: int):
+        """Stop probing a single endpoint."""
+        self._endpoints.pop(endpoint_id, None)
+        self._offsets.pop(endpoint_id, None)
+        self.scheduler.remove(endpoint_id)
+
+    def _on_endpoint_change(self, payload: str):
+        if self._runner:
+            self._next_refresh = datetime.min
+            self._wakeup.set()
+
+    async def refresh(self):
+        """Reconcile the schedule with the database, applying only the differences."""
+        endpoints = await EndpointDAO().get_all()
+
+        loaded = set()
+        for endpoint in endpoints:
+            if self._is_probeable(endpoint):
+                loaded.add(endpoint.id)
+            self.upsert(endpoint)
+
+        for endpoint_id in set(self._endpoints) - loaded:
+            self.remove(endpoint_id)
+
+        self._next_refresh = datetime.now() + self.refresh_interval
+        LOGGER.debug(f"Probe engine scheduled {len(self.scheduler)} endpoints.")
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.now()
+                if now >= self._next_refresh:
+                    await self.refresh()
+
+                # Re-arm every due endpoint before waiting for slots, so none is left unscheduled meanwhile
+                due = []
+                for endpoint_id, fire_at in self.scheduler.pop_due(now):
+                    endpoint = self._endpoints.get(endpoint_id)
+                    if not endpoint:
+                        continue
+                    try:
+                        self._rearm(endpoint, fire_at, now)
+                        due.append((endpoint_id, fire_at))
+                    except Exception as e:
+                        LOGGER.error(f"Failed to schedule endpoint ID {endpoint_id}: {e}")
+
+                for endpoint_id, fire_at in due:
+                    await self._dispatch(endpoint_id, fire_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"Probe engine loop failed: {e}")
+
+            await self._sleep_until_due()
+
+    def _rearm(self, endpoint: model.Endpoints, fire_at: datetime, now: datetime):
+        # Re-arm from the nominal fire time so the period does not drift, unless we fell a whole run behind
+        next_run = self._next_run(endpoint, fire_at)
+        if next_run <= now:
+            next_run = self._next_run(endpoint, now)
+        self.scheduler.schedule(endpoint.id, next_run)
+
+    async def _sleep_until_due(self):
+        wake_at = self._next_refresh
+        next_fire_time = self.scheduler.next_fire_time()
+        if next_fire_time and next_fire_time < wake_at:
+            wake_at = next_fire_time
+
+        timeout = max((wake_at - datetime.now()).total_seconds(), 0)
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self, endpoint_id: int, fire_at: datetime):
+        # Waiting for a free slot here keeps the number of in-flight probes bounded
+        await self.semaphore.acquire()
+
+        # The endpoint may have been removed or changed while waiting
+        endpoint = self._endpoints.get(endpoint_id)
+        if not endpoint:
+            self.semaphore.release()
+            return
+
+        lag = max((datetime.now() - fire_at).total_seconds(), 0)
+        self.fired += 1
+        self._lag_total += lag
+        self._lag_max = max(self._lag_max, lag)
+
+        task = asyncio.create_task(self._probe(endpoint))
+        self._in_flight.add(task)
+        task.add_done_callback(self._probe_done)
+
+    def _probe_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self.semaphore.release()
+
+    def metrics(self) -> dict:
+        """
+        Scheduling statistics. The load histogram counts scheduled probes per second of the minute; with good
+        spreading the peak stays close to the mean and the coefficient of variation close to 0.
+        """
+        load = [0] * 60
+        for _, fire_at in self.scheduler.items():
+            load[fire_at.second] += 1
+
+        mean = statistics.fmean(load)
+        stdev = statistics.pstdev(load)
+
+        return {
+            "running": self._runner is not None,
+            "scheduled": len(self.scheduler),
+            "in_flight": len(self._in_flight),
+            "concurrency": self.concurrency,
+            "fired": self.fired,
+            "lag_avg": round(self._lag_total / self.fired, 3) if self.fired else 0,
+            "lag_max": round(self._lag_max, 3),
+            "load": {
+                "per_second": load,
+                "mean": round(mean, 3),
+                "peak": max(load),
+                "peak_to_mean": round(max(load) / mean, 3) if mean else 0,
+                "coefficient_of_variation": round(stdev / mean, 3) if mean else 0
+            }
+        }
+
+    async def check(self, endpoint: model.Endpoints):
+        """Fetch the endpoint URL and evaluate the result against the expected status code and response."""
+        started = time.perf_counter()
+        try:
+            http_response = await self.client.get(endpoint.url)
+            response_time = int((time.perf_counter() - started) * 1000)
+
+            try:
+                body = self._sanitize(http_response.json())
+            except ValueError:
+                body = {"body": self._sanitize(http_response.text[:self.MAX_BODY_SIZE])}
+
+            status = ProbeStatus.OK.value
+            if http_response.status_code != endpoint.status_code or \
+                    not self._matches_expected(endpoint.response, body):
+                status = ProbeStatus.ERROR.value
+
+            # The whole body is matched, but a large one is stored cut to its first characters, JSON or not
+            if len(http_response.text) > self.MAX_BODY_SIZE:
+                body = {"body": self._sanitize(http_response.text[:self.MAX_BODY_SIZE]), "truncated": True}
+
+            response = {"status_code": http_response.status_code, "body": body}
+        except httpx.HTTPError as e:
+            response_time = int((time.perf_counter() - started) * 1000)
+            status = ProbeStatus.ERROR.value
+            response = {"error": f"{type(e).__name__}: {e}"}
+
+        return status, response, response_time
+
+    async def _probe(self, endpoint: model.Endpoints):
+        try:
+            created_at = datetime.now()
+            status, response, response_time = await self.check(endpoint)
+            await log_writer.write(LogRecord(
+                log_table=endpoint.log_table,
+                endpoint_id=endpoint.id,
+                status=status,
+                response=response,
+                response_time=response_time,
+                created_at=created_at
+            ))
+        except Exception as e:
+            LOGGER.error(f"Probe for endpoint ID {endpoint.id} failed: {e}")
+
+
+probe_engine = ProbeEngine()
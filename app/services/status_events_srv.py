@@ -0,0 +1,95 @@
+import asyncio
+import json
+from typing import AsyncIterator, Optional, Set
+
+from app.services.notify_srv import notify_listener
+from app.utils.enums import NotifyChannels
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+
+
+class Subscription:
+    """One connected viewer: the events it asked for, queued until its stream sends them."""
+
+    def __init__(self, endpoint_ids: Optional[Set[int]], include_results: bool, queue_size: int):
+        self.endpoint_ids = endpoint_ids
+        self.include_results = include_results
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+    def wants(self, event: dict) -> bool:
+        if event["type"] == "result" and not self.include_results:
+            return False
+        return self.endpoint_ids is None or event["endpoint_id"] in self.endpoint_ids
+
+
+class StatusEventBroker:
+    """
+    Fans probe events out to the viewers connected to this process.
+
+    Events reach every worker through a single LISTEN subscription on probe_events, whatever the number of viewers.
+    Idle viewers cost an empty queue and a keep-alive every keepalive_interval seconds. A viewer too slow to keep up
+    has its queue replaced by a resync event, telling it to reload the current state instead.
+    """
+
+    def __init__(self, queue_size: int = 1000, keepalive_interval: float = 15.0):
+        self.queue_size = queue_size
+        self.keepalive_interval = keepalive_interval
+        self._subscriptions: Set[Subscription] = set()
+        notify_listener.subscribe(NotifyChannels.PROBE_EVENTS, self._on_notify, on_reconnect=self._resync_all)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, endpoint_ids: Optional[Set[int]] = None, include_results: bool = False) -> Subscription:
+        subscription = Subscription(endpoint_ids, include_results, self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, event: dict):
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                self._put(subscription, event)
+
+    @classmethod
+    def _put(cls, subscription: Subscription, event: dict):
+        try:
+            subscription.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait({"type": "resync"})
+
+    def _on_notify(self, payload: str):
+        for event in json.loads(payload):
+            self.publish(event)
+
+    def _resync_all(self):
+        # Events sent while the listener was reconnecting are lost
+        for subscription in self._subscriptions:
+            self._put(subscription, {"type": "resync"})
+
+    async def stream(self, endpoint_ids: Optional[Set[int]] = None,
+                     include_results: bool = False) -> AsyncIterator[str]:
+        """Server-sent events for one viewer, until it disconnects."""
+        subscription = self.subscribe(endpoint_ids, include_results)
+        LOGGER.debug(f"Viewer subscribed to probe events, {len(self)} connected.")
+        try:
+            # Tells the client how long to wait before reconnecting
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+            LOGGER.debug(f"Viewer unsubscribed from probe events, {len(self)} connected.")
+
+
+status_events = StatusEventBroker()
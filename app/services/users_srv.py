@@ -1,10 +1,12 @@
 import hashlib
+from typing import Optional
 
 from fastapi import status as Status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.users_sch import UserBaseOut, UpdateUserProfile
 from app.daos.users_dao import UserDAO
-from app.utils.enums import SessionAttributes
+from app.services.principal_cache_srv import principal_cache
 from app.utils.logger import Logger
 from app.utils.response import ok, error
 
@@ -12,14 +14,14 @@ LOGGER = Logger().start_logger()
 
 
 class UserService:
-    def __init__(self):
-        self.user_dao = UserDAO()
+    def __init__(self, db: Optional[AsyncSession] = None):
+        self.user_dao = UserDAO(db)
 
     @classmethod
     async def get_user_info_from_request(cls, request):
         return ok(
             message="Successfully provided user details.",
-            data=request.session.get(SessionAttributes.USER_INFO.value)
+            data=request.state.user
         )
 
     async def update_user(self, user_id: int, user_data: UpdateUserProfile):
@@ -35,7 +37,9 @@ class UserService:
         data_to_update = user_data.model_dump()
         data_to_update = {k: v for k, v in data_to_update.items() if v is not None and k != "confirm_password"}
 
+        previous_email = user.email
         user = await self.user_dao.update(user_id, data_to_update)
+        principal_cache.invalidate(previous_email)
 
         LOGGER.info(f"Successfully updated user ID {user_id}.")
         return ok(message="Successfully updated user.", data=UserBaseOut.model_validate(user.as_dict()))
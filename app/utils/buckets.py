@@ -0,0 +1,45 @@
+import re
+from datetime import datetime, timedelta
+from typing import List
+
+from app.utils.enums import RollupGranularity
+
+ROLLUP_BUCKET_SIZES = {
+    RollupGranularity.HOUR: timedelta(hours=1),
+    RollupGranularity.DAY: timedelta(days=1),
+}
+
+DURATION_UNITS = {
+    "m": timedelta(minutes=1),
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+}
+# Longer durations reach past what timedelta and datetime can hold
+MAX_DURATION = timedelta(days=3650)
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse durations such as 5m, 72h or 90d, up to MAX_DURATION."""
+    match = re.fullmatch(r'(\d+)([mhd])', value or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration {value}. Use a number followed by m, h or d, e.g. 72h.")
+
+    unit = DURATION_UNITS[match.group(2)]
+    if int(match.group(1)) > MAX_DURATION // unit:
+        raise ValueError(f"Duration {value} is too long, at most {MAX_DURATION.days}d is allowed.")
+    return int(match.group(1)) * unit
+
+
+def bucket_start(value: datetime, size: timedelta) -> datetime:
+    """Start of the bucket of the given size that contains the value; buckets are aligned to midnight."""
+    return datetime.min + ((value - datetime.min) // size) * size
+
+
+def bucket_starts(since: datetime, until: datetime, size: timedelta) -> List[datetime]:
+    """Starts of all buckets overlapping [since, until)."""
+    starts = []
+    start = bucket_start(since, size)
+    while start < until:
+        starts.append(start)
+        start += size
+    return starts
@@ -2,7 +2,7 @@ from functools import wraps
 
 from starlette.requests import Request
 from app.config.config import Settings
-from app.daos.users_dao import UserDAO
+from app.services.principal_cache_srv import principal_cache
 from app.utils.enums import UserStatus, SessionAttributes
 from app.utils.logger import Logger
 from app.utils.response import unauthorized
@@ -18,18 +18,15 @@ def auth_required(function_to_protect):
         if not email:
             return unauthorized()
 
-        user_dao = UserDAO()
-        user = await user_dao.get_by_email(email)
+        user = await principal_cache.get(email)
         if not user:
             return unauthorized()
 
-        if user.status != UserStatus.ACTIVE.value:
+        if user["status"] != UserStatus.ACTIVE.value:
             return unauthorized()
 
-        request.session[SessionAttributes.USER_INFO.value] = user.as_dict()
-        request.session[SessionAttributes.USER_ACCESS_LEVEL.value] = user.access_level
-        request.session[SessionAttributes.USER_ID.value] = user.id
+        # Kept on the request rather than in the session, so the session is not rewritten on every request
+        request.state.user = user
         return await function_to_protect(request, *args, **kwargs)
 
     return wrapper
-
@@ -0,0 +1,98 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List
+
+from croniter import croniter
+
+from app.config.config import Settings
+
+config = Settings().probe
+
+
+class CompiledCron:
+    """A cron expression parsed once; fire times are computed from a copy of the parsed template."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self._template = croniter(expression)
+
+    def _iterator(self, after: datetime) -> croniter:
+        iterator = copy.copy(self._template)
+        iterator.set_current(after, force=True)
+        return iterator
+
+    def next_after(self, after: datetime) -> datetime:
+        """First fire time strictly after the given datetime."""
+        return self._iterator(after).get_next(datetime)
+
+    def next_n(self, after: datetime, count: int) -> List[datetime]:
+        """The next count fire times strictly after the given datetime."""
+        iterator = self._iterator(after)
+        return [iterator.get_next(datetime) for _ in range(count)]
+
+    def interval(self, after: datetime) -> timedelta:
+        """Gap between the next two fire times, the nominal period of the schedule."""
+        next_run_1, next_run_2 = self.next_n(after, 2)
+        return next_run_2 - next_run_1
+
+
+def jitter_offset(key, window: timedelta) -> timedelta:
+    """
+    Deterministic offset in [0, window) derived from a hash of the key, so every process spreads the same
+    endpoint to the same point of its interval.
+    """
+    window_ms = int(window.total_seconds() * 1000)
+    if window_ms <= 0:
+        return timedelta(0)
+
+    digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest()
+    return timedelta(milliseconds=int.from_bytes(digest, 'big') % window_ms)
+
+
+class CronCache:
+    """Bounded LRU cache of compiled cron expressions, shared by the validators and the scheduler."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._schedules: OrderedDict[str, CompiledCron] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def get(self, expression: str) -> CompiledCron:
+        """Return the compiled schedule, parsing it on first use. Invalid expressions raise and are not cached."""
+        with self._lock:
+            schedule = self._schedules.get(expression)
+            if schedule:
+                self._schedules.move_to_end(expression)
+                self.hits += 1
+                return schedule
+
+        schedule = CompiledCron(expression)
+
+        with self._lock:
+            self.misses += 1
+            self._schedules[expression] = schedule
+            self._schedules.move_to_end(expression)
+            while len(self._schedules) > self.max_size:
+                self._schedules.popitem(last=False)
+
+        return schedule
+
+    def next_after(self, expression: str, after: datetime) -> datetime:
+        return self.get(expression).next_after(after)
+
+    def next_n(self, expression: str, after: datetime, count: int) -> List[datetime]:
+        return self.get(expression).next_n(after, count)
+
+    def interval(self, expression: str, after: datetime) -> timedelta:
+        return self.get(expression).interval(after)
+
+
+cron_cache = CronCache(int(config["cron_cache_size"]))
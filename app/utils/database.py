@@ -1,23 +1,187 @@
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from fastapi import Depends
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from app.utils.hash_ring import HashRing
 from app.utils.logger import Logger
 from app.config.config import Settings
 
 config = Settings().database
+app_config = Settings().app
+log_config = Settings().log
 LOGGER = Logger().start_logger()
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{config['user']}:{config['password']}@{config['host']}/{config['name']}"
 SQLALCHEMY_ASYNC_DATABASE_URL = \
     f"postgresql+asyncpg://{config['user']}:{config['password']}@{config['host']}/{config['name']}"
 
-engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL,
-                             pool_size=100,
-                             max_overflow=2,
-                             pool_pre_ping=True,
-                             pool_use_lifo=True)
+# Besides its pool, every worker holds the LISTEN connection and the one competing for the leader lock
+RESERVED_CONNECTIONS = 2
+POOL_SIZE = max(int(config["max_connections"]) // int(app_config["workers"]) - RESERVED_CONNECTIONS, 1)
+
+# Seconds the replica is behind the primary, 0 when it has replayed everything it received
+REPLICATION_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def create_pooled_engine(url) -> AsyncEngine:
+    return create_async_engine(url,
+                               pool_size=POOL_SIZE,
+                               max_overflow=0,
+                               pool_pre_ping=True,
+                               pool_use_lifo=True)
+
+
+engine = create_pooled_engine(SQLALCHEMY_ASYNC_DATABASE_URL)
 
 SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 Base = declarative_base()
+
+
+class ReplicaSet:
+    """
+    Read replicas, taken in turn among the healthy ones. A replica is healthy when it answered its last check and,
+    with max_lag set, was at most max_lag seconds behind the primary. Without a healthy replica reads go to the primary.
+    """
+
+    def __init__(self, urls: List[str], max_lag: float, check_interval: float):
+        # Each replica server has its own max_connections, the pool of a replica is sized like the primary's
+        self.engines = [create_pooled_engine(make_url(url).set(drivername="postgresql+asyncpg")) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._healthy: List[AsyncEngine] = []
+        self._turn = 0
+        self._checker: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> AsyncEngine:
+        healthy = self._healthy
+        if not healthy:
+            return engine
+
+        self._turn = (self._turn + 1) % len(healthy)
+        return healthy[self._turn]
+
+    async def start(self):
+        if self._checker or not self.enabled:
+            return
+
+        # Checked once up front, so reads do not all go to the primary until the first interval has passed
+        await self.check()
+        self._checker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._checker:
+            self._checker.cancel()
+            await asyncio.gather(self._checker, return_exceptions=True)
+            self._checker = None
+
+        for replica in self.engines:
+            await replica.dispose()
+
+    async def check(self):
+        healthy = []
+        for replica in self.engines:
+            was_healthy = replica in self._healthy
+            try:
+                async with replica.connect() as connection:
+                    lag = await connection.scalar(REPLICATION_LAG)
+            except Exception as e:
+                if was_healthy or not self._checker:
+                    LOGGER.warning(f"Replica {replica.url.host} is unavailable, reading from the others: {e}")
+                continue
+
+            if self.max_lag and lag > self.max_lag:
+                if was_healthy or not self._checker:
+                    LOGGER.warning(f"Replica {replica.url.host} is {lag:.1f}s behind, reading from the others.")
+                continue
+
+            if not was_healthy:
+                LOGGER.info(f"Replica {replica.url.host} serves reads.")
+            healthy.append(replica)
+
+        self._healthy = healthy
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"Replica health check failed: {e}")
+
+
+replicas = ReplicaSet(config["replicas"], float(config["replica_max_lag"]), float(config["replica_check_interval"]))
+
+
+class LogShards:
+    """
+    Databases the log storage is spread over, numbered in the order of log_shards. Endpoints are assigned to a shard
+    by consistent hashing of their log table when they are created, and the shard is kept in config.endpoints so
+    results are read and written without hashing again. Shard None is the primary, where the logs of endpoints
+    created before sharding stay until they are rebalanced.
+    """
+
+    def __init__(self, urls: List[str]):
+        # Each shard has its own max_connections, the pool of a shard is sized like the primary's
+        self.engines = [create_pooled_engine(make_url(url).set(drivername="postgresql+asyncpg")) for url in urls]
+        self._sessions = [sessionmaker(shard_engine, expire_on_commit=False, class_=AsyncSession)
+                          for shard_engine in self.engines]
+        self.ring = HashRing(len(self.engines)) if self.engines else None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def assign(self, log_table: str) -> Optional[int]:
+        """Shard for the logs of a new endpoint, None while sharding is off."""
+        return self.ring.shard_for(log_table) if self.enabled else None
+
+    def targets(self) -> List[Optional[int]]:
+        """Every place logs may be stored, the primary first."""
+        return [None, *range(len(self.engines))]
+
+    def session(self, shard: Optional[int]) -> AsyncSession:
+        return SessionLocal() if shard is None else self._sessions[shard]()
+
+    async def dispose(self):
+        for shard_engine in self.engines:
+            await shard_engine.dispose()
+
+
+log_shards = LogShards(log_config["shards"])
+
+
+def create_read_session() -> AsyncSession:
+    """A session on the next healthy replica, or on the primary when there is none."""
+    return SessionLocal(bind=replicas.choose())
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency providing one session per request, shared by every DAO of the request and closed after it."""
+    async with SessionLocal() as session:
+        yield session
+
+
+async def get_read_db(db: AsyncSession = Depends(get_db)) -> AsyncIterator[AsyncSession]:
+    """Dependency providing the session reads of the request go to, the one of get_db when there are no replicas."""
+    if not replicas.enabled:
+        yield db
+        return
+
+    async with create_read_session() as session:
+        yield session
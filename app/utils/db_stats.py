@@ -0,0 +1,51 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.utils.database import engine, log_shards, replicas
+from app.utils.logger import Logger
+
+LOGGER = Logger().start_logger()
+
+# Counters of the request being handled, None outside of requests
+request_stats: ContextVar[Optional[dict]] = ContextVar("request_stats", default=None)
+
+
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = request_stats.get()
+    if stats is not None:
+        stats["checkouts"] += 1
+
+
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    stats = request_stats.get()
+    if stats is not None:
+        stats["queries"] += 1
+
+
+for counted_engine in [engine, *replicas.engines, *log_shards.engines]:
+    event.listen(counted_engine.sync_engine, "checkout", count_checkout)
+    event.listen(counted_engine.sync_engine, "before_cursor_execute", count_query)
+
+
+class DatabaseStatsMiddleware:
+    """Counts the pool checkouts and queries of each request, logged at debug level once it is handled."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = {"checkouts": 0, "queries": 0}
+        token = request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_stats.reset(token)
+            LOGGER.debug(f"{scope['method']} {scope['path']} used {stats['queries']} queries "
+                         f"and {stats['checkouts']} pool checkouts.")
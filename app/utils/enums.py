@@ -6,6 +6,24 @@ class DatabaseSchemas(Enum):
     LOG_SCHEMA = 'log'
 
 
+class NotifyChannels(Enum):
+    ENDPOINT_CHANGES = 'endpoint_changes'
+    PROBE_EVENTS = 'probe_events'
+    USER_CHANGES = 'user_changes'
+    SESSION_CHANGES = 'session_changes'
+
+
+class AdvisoryLocks(Enum):
+    SCHEMA_SETUP = 72001
+    LEADER = 72002
+
+
+class LogStorage(Enum):
+    TABLE = 'table'
+    PARTITIONED = 'partitioned'
+    RUNS = 'runs'
+
+
 class AccessLevel(Enum):
     ADMIN = 'Admin'
     NORMAL = 'User'
@@ -25,7 +43,31 @@ class AuthMethods(Enum):
 class SessionAttributes(Enum):
     OAUTH_STATE = 'oauth_state'
     AUTH_METHOD = 'auth_method'
-    USER_ID = 'user_id'
     USER_NAME = 'user_name'
-    USER_ACCESS_LEVEL = 'user_access_level'
-    USER_INFO = 'user_info'
+
+
+class SessionStores(Enum):
+    COOKIE = 'cookie'
+    MEMORY = 'memory'
+    DATABASE = 'database'
+
+
+class ProbeStatus(Enum):
+    OK = 'ok'
+    ERROR = 'error'
+
+
+class RollupGranularity(Enum):
+    HOUR = 'hour'
+    DAY = 'day'
+
+
+class UptimeBucket(Enum):
+    FIVE_MINUTES = '5m'
+    HOUR = '1h'
+    DAY = '1d'
+
+
+class ExportFormat(Enum):
+    NDJSON = 'ndjson'
+    CSV = 'csv'
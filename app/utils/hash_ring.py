@@ -0,0 +1,26 @@
+import bisect
+import hashlib
+from typing import List, Tuple
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto shards numbered 0 to shard_count - 1. Every shard owns vnodes points of the ring
+    and a key goes to the shard of the first point at or after its own, so adding a shard only moves the keys that
+    land on the new shard's points, about 1 / shard_count of them.
+    """
+
+    def __init__(self, shard_count: int, vnodes: int = 256):
+        self.shard_count = shard_count
+        points: List[Tuple[int, int]] = sorted((_point(f"shard-{shard}-{vnode}"), shard)
+                                               for shard in range(shard_count) for vnode in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        index = bisect.bisect_left(self._hashes, _point(key)) % len(self._hashes)
+        return self._shards[index]
@@ -0,0 +1,40 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request
+from pydantic_core import to_json
+
+
+def validators(last_modified: Optional[datetime], *parts) -> Dict[str, str]:
+    """
+    ETag and Last-Modified headers of a representation built from the given parts, e.g. the models it is encoded
+    from. Clients must revalidate on every request, which costs a 304 without a body as long as nothing changed.
+    """
+    fingerprint = to_json(parts, serialize_unknown=True)
+    headers = {
+        "ETag": f'"{hashlib.blake2b(fingerprint, digest_size=16).hexdigest()}"',
+        "Cache-Control": "no-cache"
+    }
+    if last_modified:
+        # Timestamps are naive local times
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified_since(request: Request, headers: Dict[str, str]) -> bool:
+    """Whether the client's copy is still current; If-None-Match takes precedence over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+        return "*" in etags or headers["ETag"] in etags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
@@ -1,19 +1,38 @@
+from typing import Any
+
 from fastapi import status as Status
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from pydantic_core import to_json
 
 from app.utils.logger import Logger
 
 LOGGER = Logger().start_logger()
 
 
-def ok(status="success", message="", data=None):
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse that serializes pydantic models, dicts, lists and datetimes straight to bytes with pydantic-core,
+    without first copying the payload into plain dicts like jsonable_encoder does. Anything pydantic-core does not
+    know is still handed to jsonable_encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content, timedelta_mode="float", fallback=jsonable_encoder)
+
+
+def ok(status="success", message="", data=None, headers=None):
     """HTTP Response 200"""
     return custom_response({
         "status": status,
         "message": message,
         "data": data
-    }, Status.HTTP_200_OK)
+    }, Status.HTTP_200_OK, headers)
+
+
+def not_modified(headers=None):
+    """HTTP Response 304"""
+    return Response(status_code=Status.HTTP_304_NOT_MODIFIED, headers=headers)
 
 
 def unauthorized():
@@ -51,6 +70,6 @@ def error(status="error", message="Oops!!! Something went wrong. Contact your su
     }, status_code)
 
 
-def custom_response(resp, status_code):
-    return JSONResponse(status_code=status_code, content=jsonable_encoder(resp))
+def custom_response(resp, status_code, headers=None):
+    return FastJSONResponse(status_code=status_code, content=resp, headers=headers)
 
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+from datetime import datetime
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+class CronScheduler:
+    """
+    Min-heap of (fire_at, key) entries keyed on the next fire time.
+
+    Scheduling, re-arming and popping a due entry cost O(log n). Removed or re-scheduled entries are only marked
+    as stale and skipped when they reach the top of the heap; the heap is compacted once stale entries outnumber
+    the live ones, so memory stays proportional to the number of scheduled keys.
+    """
+
+    _REMOVED = object()
+
+    def __init__(self):
+        self._heap: List[list] = []
+        self._entries: Dict[Hashable, list] = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def schedule(self, key: Hashable, fire_at: datetime):
+        """Add a key or move an already scheduled key to a new fire time."""
+        if key in self._entries:
+            self.remove(key)
+
+        entry = [fire_at, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, key: Hashable):
+        """Unschedule a key. Unknown keys are ignored."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        entry[-1] = self._REMOVED
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def fire_time(self, key: Hashable) -> Optional[datetime]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def items(self) -> Iterator[Tuple[Hashable, datetime]]:
+        """Iterate over (key, fire_at) of all scheduled keys, in no particular order."""
+        for key, entry in self._entries.items():
+            yield key, entry[0]
+
+    def next_fire_time(self) -> Optional[datetime]:
+        """Earliest fire time of all scheduled keys, None when nothing is scheduled."""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[tuple]:
+        """Pop every key due at or before now as (key, fire_at) pairs. Popped keys must be re-armed by the caller."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, key = heapq.heappop(self._heap)
+            if key is self._REMOVED:
+                continue
+            del self._entries[key]
+            due.append((key, fire_at))
+        return due
+
+    def _drop_stale(self):
+        while self._heap and self._heap[0][-1] is self._REMOVED:
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if entry[-1] is not self._REMOVED]
+        heapq.heapify(self._heap)
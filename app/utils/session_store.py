@@ -0,0 +1,136 @@
+import copy
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.config import Settings
+from app.daos.sessions_dao import SessionDAO
+from app.services.notify_srv import notify_listener
+from app.utils.enums import NotifyChannels, SessionStores
+from app.utils.ttl_cache import TTLCache
+
+config = Settings().app
+cache_config = Settings().cache
+
+
+class MemorySessionStore:
+    """Sessions kept in this process. Other workers cannot see them, so it only fits a single worker."""
+
+    def __init__(self, max_size: int, max_age: int):
+        self.sessions = TTLCache(max_size, max_age)
+
+    async def load(self, session_id: str) -> Optional[dict]:
+        return self.sessions.get(session_id)
+
+    async def save(self, session_id: str, data: dict):
+        self.sessions.set(session_id, data)
+
+    async def delete(self, session_id: str):
+        self.sessions.invalidate(session_id)
+
+
+class DatabaseSessionStore:
+    """
+    Sessions in config.sessions, shared by every worker. Reads are cached in process; a deleted session is dropped
+    from the caches of the other workers through the NOTIFY that SessionDAO sends with the delete.
+    """
+
+    def __init__(self, max_size: int, max_age: int, cache_ttl: float):
+        self.max_age = max_age
+        self.cache = TTLCache(max_size, cache_ttl)
+        if self.cache.enabled:
+            notify_listener.subscribe(NotifyChannels.SESSION_CHANGES, self.cache.invalidate,
+                                      on_reconnect=self.cache.clear)
+
+    async def load(self, session_id: str) -> Optional[dict]:
+        data = self.cache.get(session_id)
+        if data is None:
+            data = await SessionDAO().get(session_id)
+            if data is not None:
+                self.cache.set(session_id, data)
+        return data
+
+    async def save(self, session_id: str, data: dict):
+        await SessionDAO().save(session_id, data, datetime.now() + timedelta(seconds=self.max_age))
+        self.cache.set(session_id, data)
+
+    async def delete(self, session_id: str):
+        self.cache.invalidate(session_id)
+        await SessionDAO().delete(session_id)
+
+
+def create_session_store():
+    max_age = int(config["session_lifetime"])
+    max_size = int(config["session_store_size"])
+    if config["session_store"] == SessionStores.MEMORY.value:
+        # Each worker would only know its own sessions, signing users out whenever another worker answers
+        if int(config["workers"]) > 1:
+            raise ValueError(f"The {SessionStores.MEMORY.value} session store only works with a single worker, "
+                             f"use the {SessionStores.DATABASE.value} store with app_workers={config['workers']}")
+        return MemorySessionStore(max_size, max_age)
+    if config["session_store"] == SessionStores.DATABASE.value:
+        return DatabaseSessionStore(max_size, max_age, float(cache_config["principal_ttl"]))
+    raise ValueError(f"Unknown session store {config['session_store']}, valid stores are: "
+                     f"{', '.join(store.value for store in SessionStores)}")
+
+
+class ServerSideSessionMiddleware:
+    """
+    Drop-in for Starlette's SessionMiddleware that keeps the session data in a store, the cookie only carries a random
+    session ID.
+
+    The store is only written when a request changes the session, which is on sign in and sign out. Every change is
+    saved under a new ID, so an ID handed out before signing in never becomes a signed-in one. Sessions expire
+    max_age seconds after they were last changed.
+    """
+
+    def __init__(self, app: ASGIApp, store, session_cookie: str = "session", max_age: int = 14 * 24 * 60 * 60,
+                 path: str = "/", same_site: str = "lax", https_only: bool = False):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(self.session_cookie)
+        initial = await self.store.load(session_id) if session_id else None
+        # Stores hand out the dict they keep, the request gets its own copy
+        scope["session"] = copy.deepcopy(initial) if initial else {}
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                if session != (initial or {}):
+                    if initial is not None:
+                        await self.store.delete(session_id)
+
+                    if session:
+                        session_id_new = secrets.token_urlsafe(32)
+                        await self.store.save(session_id_new, copy.deepcopy(session))
+                        self._set_cookie(message, f"{session_id_new}; path={self.path}; Max-Age={self.max_age}; ")
+                    else:
+                        self._set_cookie(message, self._expired())
+                elif session_id and initial is None:
+                    # Unknown or expired session, the client can stop sending it
+                    self._set_cookie(message, self._expired())
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _expired(self) -> str:
+        return f"null; path={self.path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+
+    def _set_cookie(self, message: Message, value: str):
+        MutableHeaders(scope=message).append("Set-Cookie", f"{self.session_cookie}={value}{self.security_flags}")
@@ -0,0 +1,82 @@
+"""
+Compare encoding API responses the old way, as_dict + model_validate + jsonable_encoder, with the fast path of
+app.utils.response, model_validate from attributes + pydantic-core.
+
+    python -m benchmarks.response_encoding [--endpoints 1000] [--logs 5000] [--repeat 20]
+
+Both paths are checked to produce the same JSON before they are timed.
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models import db_models as model
+from app.schemas.endpoints_sch import BaseEndpointsOut
+from app.utils.response import ok
+
+
+class LogRow(NamedTuple):
+    id: int
+    status: str
+    created_at: datetime
+    response_time: int
+
+
+def make_endpoints(count: int):
+    now = datetime.now()
+    return [model.Endpoints(id=index, log_table=f"t{index:036d}", name=f"Endpoint {index}",
+                            description="Health check", url=f"https://example.com/{index}/health", threshold=3,
+                            application_id=index % 10, cron="*/5 * * * *", status_code=200,
+                            response={"status": "UP", "checks": [{"name": "db", "status": "UP"}]}, type="GET",
+                            jitter=None, retention_days=None, created_at=now)
+            .with_status(model.EndpointStatus(status="ok", last_checked_at=now, response_time=120 + index % 50,
+                                              consecutive_failures=0))
+            for index in range(count)]
+
+
+def make_logs(count: int):
+    now = datetime.now()
+    return [LogRow(index, "ok", now - timedelta(minutes=index), 100 + index % 90)._asdict() for index in range(count)]
+
+
+def encode_endpoints_old(endpoints):
+    data = [BaseEndpointsOut.model_validate(endpoint.as_dict()) for endpoint in endpoints]
+    return JSONResponse(content=jsonable_encoder({"status": "success", "message": "", "data": data})).body
+
+
+def encode_endpoints_new(endpoints):
+    return ok(data=[BaseEndpointsOut.model_validate(endpoint, from_attributes=True) for endpoint in endpoints]).body
+
+
+def encode_logs_old(logs):
+    return JSONResponse(content=jsonable_encoder({"status": "success", "message": "", "data": {"logs": logs}})).body
+
+
+def encode_logs_new(logs):
+    return ok(data={"logs": logs}).body
+
+
+def compare(name: str, old, new, payload, repeat: int):
+    if json.loads(old(payload)) != json.loads(new(payload)):
+        raise SystemExit(f"{name}: the old and the new path produce different JSON.")
+
+    old_time = min(timeit.repeat(lambda: old(payload), number=1, repeat=repeat))
+    new_time = min(timeit.repeat(lambda: new(payload), number=1, repeat=repeat))
+    print(f"{name:<24} old {old_time * 1000:8.2f} ms   new {new_time * 1000:8.2f} ms   {old_time / new_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the encoding of API responses.")
+    parser.add_argument("--endpoints", type=int, default=1000, help="number of endpoints in GET /endpoints")
+    parser.add_argument("--logs", type=int, default=5000, help="number of log rows in GET /endpoints/{id}/status")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per path, the fastest is reported")
+    args = parser.parse_args()
+
+    compare(f"{args.endpoints} endpoints", encode_endpoints_old, encode_endpoints_new,
+            make_endpoints(args.endpoints), args.repeat)
+    compare(f"{args.logs} log rows", encode_logs_old, encode_logs_new, make_logs(args.logs), args.repeat)
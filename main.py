@@ -19,10 +19,13 @@ events.configure(app)
 if __name__ == "__main__":
     LOGGING_CONFIG["formatters"]["default"]["fmt"] = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     LOGGING_CONFIG["formatters"]["access"]["fmt"] = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    # Workers are separate processes that import the app themselves, which uvicorn needs an import string for
+    workers = int(config['workers'])
     uvicorn.run(
-        app,
+        app if workers == 1 else "main:app",
         host=config['host'],
         port=int(config['port']),
         ssl_keyfile=config.get('ssl_key', None),
         ssl_certfile=config.get('ssl_cert', None),
+        workers=workers,
     )